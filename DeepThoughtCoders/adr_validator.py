@@ -4,6 +4,113 @@ from backend.node.genvm.icontract import IContract
 from backend.node.genvm.equivalence_principle import call_llm_with_principle
 
 
+# Strings, // comments, bare words, brackets and runs of anything else, in that order
+JSON_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|//[^\n]*|[A-Za-z_]\w*|[{}\[\]]|[^"{}\[\]/A-Za-z_]+|["/]')
+JSON_CLOSING = {"{": "}", "[": "]"}
+JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Tokens that can appear in JSON: strings, brackets, literals, exponents and runs of numbers and separators
+JSON_VALID_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]|true|false|null|[eE]\d*|(?:[\s,:]|[+-]?\d+(?:\.\d+)?(?![\d.]))*')
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+def _json_schema_error(value, schema: dict | None) -> str | None:
+    if schema is None:
+        return None
+    if not isinstance(value, dict):
+        return "LLM output is not a JSON object"
+    for field, expected in schema.items():
+        if field not in value:
+            return f"LLM output is missing '{field}'"
+        # bool is a subclass of int, but a boolean is never a valid number here
+        if expected is not object and (
+            not isinstance(value[field], expected)
+            or expected is int and isinstance(value[field], bool)
+        ):
+            return f"LLM output field '{field}' is not of type {expected.__name__}"
+    return None
+
+
+def extract_json(text: str, schema: dict | None = None):
+    """
+    Returns the first JSON object or array found in an LLM output.
+    When a schema is given, returns the first object whose fields exist with the given
+    types (object: any type), skipping other values such as a "[3]" quoted in the prose.
+    Python literals outside strings, trailing commas and // comments are tolerated.
+    A value nested in another one is never returned on its own, so a truncated answer
+    fails instead of yielding one of its fields. Runs in linear time.
+    Raises ValueError when no matching value is found.
+    """
+    try:
+        # Fast path for outputs that are already plain JSON
+        value = json.loads(text, strict=False)
+    except (ValueError, RecursionError):
+        value = None
+    if isinstance(value, (dict, list)):
+        error = _json_schema_error(value, schema)
+        if error:
+            raise ValueError(error)
+        return value
+
+    # Rewrite the output as JSON tokens. A value may start at a bracket outside any other
+    # bracket, or at a bracket that follows prose rather than JSON, e.g. "[see {...}]"
+    out = []
+    prose = [0]  # running count of prose tokens in out
+    starts = []
+    closes = {}  # index in out of an opening bracket -> index of its closing bracket
+    stack = []   # (expected closing bracket, index of the opening bracket in out)
+    after_prose = False
+    for token in JSON_TOKEN_PATTERN.finditer(text):
+        token = token.group()
+        if token.startswith("//"):
+            continue
+        if token in JSON_CLOSING:
+            if not stack or after_prose:
+                starts.append(len(out))
+            stack.append((JSON_CLOSING[token], len(out)))
+        elif token in ("}", "]"):
+            # Drop trailing commas, also across whitespace and skipped comments
+            index = len(out) - 1
+            while index >= 0 and out[index][:1] not in ('"', "{", "[", "}", "]"):
+                stripped = out[index].rstrip(", \t\r\n")
+                out[index] = stripped
+                if stripped:
+                    break
+                index -= 1
+            if stack and stack[-1][0] == token:
+                closes[stack.pop()[1]] = len(out)
+            else:
+                stack = []
+        else:
+            token = JSON_LITERALS.get(token, token)
+        is_prose = not JSON_VALID_TOKEN_PATTERN.fullmatch(token)
+        out.append(token)
+        prose.append(prose[-1] + is_prose)
+        if token.strip():
+            after_prose = is_prose
+
+    offsets = [0]
+    for token in out:
+        offsets.append(offsets[-1] + len(token))
+    cleaned = "".join(out)
+
+    # A span holding prose is skipped without decoding. The spans that are decoded hold
+    # no prose, hence no other start, so they never overlap and the work stays linear.
+    error = None
+    for start in starts:
+        end = closes.get(start)
+        if end is None or prose[end + 1] != prose[start]:
+            continue
+        try:
+            value = JSON_DECODER.decode(cleaned[offsets[start]:offsets[end + 1]])
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        candidate_error = _json_schema_error(value, schema)
+        if candidate_error is None:
+            return value
+        error = error or candidate_error
+    raise ValueError(error or "No JSON value found in LLM output")
+
+
 class ADRValidator(IContract):
     def __init__(self):
         self.owner = contract_runner.from_address
@@ -108,8 +215,7 @@ class ADRValidator(IContract):
             prompt,
             eq_principle="The result['accepted'] has to be exactly the same",
         )
-        result_clean = result.replace("True", "true").replace("False", "false")
-        output = json.loads(result_clean)
+        output = extract_json(result, {"accepted": bool, "reasoning": str})
 
         print(output)
 
@@ -0,0 +1,196 @@
+"""
+Benchmark for the GenLayerDAO contract in bounty-dao-v2.py.
+
+The contract is loaded outside the simulator: the genvm modules it imports are
+replaced by stubs and a stub LLM answers every prompt with an accepted proposal,
+so only the contract's own work and the number of LLM rounds are measured.
+
+Scenarios:
+    snapshot  State size and proposal cost against holder count, for the balance
+              checkpoints kept by the contract and for a full copy of the balances
+              taken on every proposal.
+    proposal  LLM calls and latency of an accepted proposal, with a stub LLM that
+              takes a fixed time per consensus round: the merged evaluate-and-refine
+              call, the two-step flow (evaluate, then refine) and the fallback to the
+              two-step flow when the merged answer can't be used.
+
+Example usage:
+    python bench_bounty_dao.py snapshot --holders 1000 10000 50000 --proposals 100
+    python bench_bounty_dao.py proposal --llm-ms 200 --proposals 20
+"""
+import argparse
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import types
+
+CONTRACT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bounty-dao-v2.py")
+ACCEPTED = json.dumps({
+    "reasoning": "The proposal grows the community.",
+    "proposal_accepted": True,
+    "refined_description": "Organize a GenLayer meetup.",
+    "refined_reward": "100 tokens.",
+})
+# A merged answer without the refined fields, which sends the contract to the two-step flow
+INCOMPLETE = json.dumps({"reasoning": "The proposal grows the community.", "proposal_accepted": True})
+
+
+class StubLLM:
+    """
+    Answers every prompt with the same output after a fixed delay, and counts the calls.
+    The merged evaluate-and-refine prompt can be given a different output.
+    """
+    def __init__(self, output: str, delay: float = 0, merged_output: str | None = None):
+        self.output = output
+        self.delay = delay
+        self.merged_output = merged_output
+        self.calls = 0
+
+    async def __call__(self, prompt: str, eq_principle: str, comparative: bool = True) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.merged_output is not None and "First, evaluate" in prompt:
+            return self.merged_output
+        return self.output
+
+
+def load_contract(llm: StubLLM) -> dict:
+    """
+    Executes the contract source with stubbed genvm modules and returns its namespace.
+    """
+    icontract = types.ModuleType("backend.node.genvm.icontract")
+    icontract.IContract = object
+    equivalence_principle = types.ModuleType("backend.node.genvm.equivalence_principle")
+    equivalence_principle.call_llm_with_principle = llm
+    sys.modules["backend.node.genvm.icontract"] = icontract
+    sys.modules["backend.node.genvm.equivalence_principle"] = equivalence_principle
+    builtins.contract_runner = types.SimpleNamespace(from_address="0x0")
+
+    with open(CONTRACT, encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": "bounty_dao_v2"}
+    exec(compile(source, CONTRACT, "exec"), namespace)
+    return namespace
+
+
+def state_size(*values) -> int:
+    return sum(len(json.dumps(value)) for value in values)
+
+
+def bench_snapshot(holders: int, proposals: int, churn: float) -> dict:
+    contract = load_contract(StubLLM(ACCEPTED))
+    dao = contract["GenLayerDAO"]()
+    dao.total_supply = dao.token_supply = holders * (proposals + 2)
+    addresses = [f"0x{i:040x}" for i in range(holders)]
+    for address in addresses:
+        dao._send_tokens(1, address)
+
+    # Between proposals a fraction of the holders buy tokens, so checkpoints grow with
+    # balance changes while a full copy grows with the number of holders
+    changed_per_proposal = max(1, int(holders * churn))
+    proposal_times = []
+    copy_times = []
+    copies = []
+    for n in range(proposals):
+        builtins.contract_runner.from_address = addresses[n % holders]
+        start = time.perf_counter()
+        asyncio.run(dao.propose_bounty(f"Meetup number {n}"))
+        proposal_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        copies.append(dao.balances.copy())
+        copy_times.append(time.perf_counter() - start)
+
+        for i in range(changed_per_proposal):
+            dao._send_tokens(1, addresses[(n * changed_per_proposal + i) % holders])
+
+    start = time.perf_counter()
+    for bounty in dao.bounties.values():
+        for address in addresses[:100]:
+            dao._get_balance_at(address, bounty.snapshot_epoch)
+    lookup_time = (time.perf_counter() - start) / (len(dao.bounties) * 100)
+
+    return {
+        "holders": holders,
+        "checkpoint_state_kb": state_size(dao.balances, dao.balance_checkpoints) / 1024,
+        "copy_state_kb": state_size(dao.balances, copies) / 1024,
+        "proposal_ms": statistics.median(proposal_times) * 1000,
+        "copy_ms": statistics.median(copy_times) * 1000,
+        "lookup_us": lookup_time * 1_000_000,
+    }
+
+
+async def propose_two_step(dao, proposal: str):
+    """
+    The flow propose_bounty ran before the merged call: a constitution check, then refinement.
+    """
+    output = await dao._evaluate_proposal(builtins.contract_runner.from_address, proposal)
+    if output["proposal_accepted"]:
+        await dao.refine_bounty_details(proposal)
+
+
+def bench_proposal(flow: str, proposals: int, llm_ms: float) -> dict:
+    llm = StubLLM(ACCEPTED, llm_ms / 1000, INCOMPLETE if flow == "fallback" else None)
+    contract = load_contract(llm)
+    dao = contract["GenLayerDAO"]()
+    builtins.contract_runner.from_address = "0x1"
+    dao._send_tokens(1, "0x1")
+
+    times = []
+    for n in range(proposals):
+        proposal = f"Meetup number {n}"
+        start = time.perf_counter()
+        # refine_bounty_details prints the raw LLM output
+        with contextlib.redirect_stdout(io.StringIO()):
+            if flow == "two-step":
+                asyncio.run(propose_two_step(dao, proposal))
+            else:
+                asyncio.run(dao.propose_bounty(proposal))
+        times.append(time.perf_counter() - start)
+
+    return {
+        "flow": flow,
+        "calls": llm.calls / proposals,
+        "median_ms": statistics.median(times) * 1000,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+    snapshot = subparsers.add_parser("snapshot", help="balance checkpoints against full balance copies")
+    snapshot.add_argument("--holders", type=int, nargs="+", default=[1000, 10000, 50000])
+    snapshot.add_argument("--proposals", type=int, default=100)
+    snapshot.add_argument("--churn", type=float, default=0.01, help="fraction of holders whose balance changes between proposals")
+    proposal = subparsers.add_parser("proposal", help="merged proposal call against the two-step flow")
+    proposal.add_argument("--proposals", type=int, default=20)
+    proposal.add_argument("--llm-ms", type=float, default=200, help="stub LLM latency per consensus round")
+    args = parser.parse_args()
+
+    if args.scenario == "snapshot":
+        print(f"{args.proposals} proposals, {args.churn:.0%} of the holders change balance between proposals")
+        print(f"{'holders':>8} {'checkpoints KB':>15} {'copies KB':>12} {'propose ms':>11} {'copy ms':>9} {'lookup us':>10}")
+        for holders in args.holders:
+            row = bench_snapshot(holders, args.proposals, args.churn)
+            print(
+                f"{row['holders']:>8} {row['checkpoint_state_kb']:>15.1f} {row['copy_state_kb']:>12.1f}"
+                f" {row['proposal_ms']:>11.3f} {row['copy_ms']:>9.3f} {row['lookup_us']:>10.2f}"
+            )
+    elif args.scenario == "proposal":
+        print(f"{args.proposals} accepted proposals, {args.llm_ms:.0f} ms per LLM consensus round")
+        print(f"{'flow':>9} {'LLM calls':>10} {'median ms':>10}")
+        for flow in ("merged", "two-step", "fallback"):
+            row = bench_proposal(flow, args.proposals, args.llm_ms)
+            print(f"{row['flow']:>9} {row['calls']:>10.1f} {row['median_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Throughput benchmark for the motion queue of the ConstitutionalDAO contract in pure-llm-dao-v1.py.
+
+The contract is loaded outside the simulator: the genvm modules it imports are
+replaced by stubs and a stub LLM, which takes a fixed time per consensus round,
+answers every motion with a known patch. The same motions are run one
+execute_motion call each and through submit_motion and execute_pending.
+
+The motions add members, set budget lines keyed by digit-only IDs (entries of a
+dict, not list positions) and, for one motion in twenty, amend the same article
+of the constitution. Those amendments conflict with each other and are
+re-queued to a later batch.
+
+Example usage:
+    python bench_motion_queue.py --motions 100 --batch-size 10 20 50 --llm-ms 200
+"""
+import argparse
+import asyncio
+import builtins
+import json
+import os
+import sys
+import time
+import types
+
+CONTRACT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pure-llm-dao-v1.py")
+BATCH_MARKER = "Users have made the following motions, in order:\n"
+SINGLE_MARKER = "has made the following motion:\n"
+
+
+class StubLLM:
+    """
+    Answers motions with the patches they were generated with, after a fixed delay per call.
+    """
+    def __init__(self, patches: dict[str, list], delay: float):
+        self.patches = patches
+        self.delay = delay
+        self.calls = 0
+        self.prompt_chars = 0
+
+    async def __call__(self, prompt: str, eq_principle: str, comparative: bool = True) -> str:
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        await asyncio.sleep(self.delay)
+        if BATCH_MARKER in prompt:
+            motions = json.loads(prompt.split(BATCH_MARKER)[1].split("\n")[0])
+            results = [
+                {"motion_id": item["motion_id"], "reasoning": "Allowed.", "patch": self.patches[item["motion"]]}
+                for item in motions
+            ]
+            return json.dumps({"results": results})
+        motion = prompt.split(SINGLE_MARKER)[1].split("\n")[0]
+        return json.dumps({"reasoning": "Allowed.", "patch": self.patches[motion]})
+
+
+def load_contract(llm: StubLLM) -> dict:
+    """
+    Executes the contract source with stubbed genvm modules and returns its namespace.
+    """
+    icontract = types.ModuleType("backend.node.genvm.icontract")
+    icontract.IContract = object
+    equivalence_principle = types.ModuleType("backend.node.genvm.equivalence_principle")
+    equivalence_principle.call_llm_with_principle = llm
+    sys.modules["backend.node.genvm.icontract"] = icontract
+    sys.modules["backend.node.genvm.equivalence_principle"] = equivalence_principle
+    builtins.contract_runner = types.SimpleNamespace(from_address="0x0")
+
+    with open(CONTRACT, encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": "pure_llm_dao_v1"}
+    exec(compile(source, CONTRACT, "exec"), namespace)
+    return namespace
+
+
+def make_motions(count: int) -> dict[str, list]:
+    """
+    Returns count motions, mapped to the patch the stub LLM answers them with.
+    """
+    motions = {}
+    for i in range(count):
+        if i % 20 == 19:
+            motion = f"Amend article 2 of the constitution, revision {i}"
+            patch = [{"op": "replace", "path": "/constitution/1", "value": f"2. Revision {i}"}]
+        elif i % 2:
+            motion = f"Set budget line {1000 + i} to {i} tokens"
+            patch = [{"op": "add", "path": f"/budget/{1000 + i}", "value": i}]
+        else:
+            motion = f"Add 0x{i:040x} to the members"
+            patch = [{"op": "add", "path": "/members/-", "value": f"0x{i:040x}"}]
+        motions[motion] = patch
+    return motions
+
+
+def new_dao(llm: StubLLM):
+    dao = load_contract(llm)["ConstitutionalDAO"]()
+    dao.sections["members"] = []
+    dao.sections["budget"] = {}
+    return dao
+
+
+def bench_sequential(motions: dict[str, list], delay: float) -> dict:
+    llm = StubLLM(motions, delay)
+    dao = new_dao(llm)
+    start = time.perf_counter()
+    for motion in motions:
+        asyncio.run(dao.execute_motion(motion))
+    elapsed = time.perf_counter() - start
+    return {"mode": "sequential", "calls": llm.calls, "requeued": 0, "elapsed": elapsed, "llm": llm, "dao": dao}
+
+
+def bench_queue(motions: dict[str, list], delay: float, batch_size: int) -> dict:
+    llm = StubLLM(motions, delay)
+    dao = new_dao(llm)
+    for motion in motions:
+        dao.submit_motion(motion)
+    requeued = 0
+    start = time.perf_counter()
+    while dao.get_pending_motions():
+        outcomes = asyncio.run(dao.execute_pending(batch_size))
+        requeued += sum(status == "pending" for status in outcomes.values())
+    elapsed = time.perf_counter() - start
+    executed = sum(record["status"] == "executed" for record in dao.motions.values())
+    if executed != len(motions):
+        raise RuntimeError(f"Only {executed} of {len(motions)} motions were executed")
+    return {"mode": f"queue/{batch_size}", "calls": llm.calls, "requeued": requeued, "elapsed": elapsed, "llm": llm, "dao": dao}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--motions", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[10, 20, 50])
+    parser.add_argument("--llm-ms", type=float, default=200, help="stub LLM latency per consensus round")
+    args = parser.parse_args()
+
+    motions = make_motions(args.motions)
+    delay = args.llm_ms / 1000
+    rows = [bench_sequential(motions, delay)]
+    rows += [bench_queue(motions, delay, batch_size) for batch_size in args.batch_size]
+
+    reference = rows[0]["dao"].get_state()
+    print(f"{args.motions} motions, {args.llm_ms:.0f} ms per LLM consensus round")
+    print(f"{'mode':>10} {'LLM calls':>10} {'re-queued':>10} {'prompt KB':>10} {'seconds':>8} {'motions/s':>10} {'same state':>11}")
+    for row in rows:
+        print(
+            f"{row['mode']:>10} {row['calls']:>10} {row['requeued']:>10} {row['llm'].prompt_chars / 1024:>10.1f}"
+            f" {row['elapsed']:>8.2f} {args.motions / row['elapsed']:>10.1f}"
+            f" {str(row['dao'].get_state() == reference):>11}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,117 @@
+import hashlib
 import json
+import re
+from bisect import bisect_right
 from backend.node.genvm.icontract import IContract
 from backend.node.genvm.equivalence_principle import call_llm_with_principle
 
+# Strings, // comments, bare words, brackets and runs of anything else, in that order
+JSON_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|//[^\n]*|[A-Za-z_]\w*|[{}\[\]]|[^"{}\[\]/A-Za-z_]+|["/]')
+JSON_CLOSING = {"{": "}", "[": "]"}
+JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Tokens that can appear in JSON: strings, brackets, literals, exponents and runs of numbers and separators
+JSON_VALID_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]|true|false|null|[eE]\d*|(?:[\s,:]|[+-]?\d+(?:\.\d+)?(?![\d.]))*')
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+def _json_schema_error(value, schema: dict | None) -> str | None:
+    if schema is None:
+        return None
+    if not isinstance(value, dict):
+        return "LLM output is not a JSON object"
+    for field, expected in schema.items():
+        if field not in value:
+            return f"LLM output is missing '{field}'"
+        # bool is a subclass of int, but a boolean is never a valid number here
+        if expected is not object and (
+            not isinstance(value[field], expected)
+            or expected is int and isinstance(value[field], bool)
+        ):
+            return f"LLM output field '{field}' is not of type {expected.__name__}"
+    return None
+
+
+def extract_json(text: str, schema: dict | None = None):
+    """
+    Returns the first JSON object or array found in an LLM output.
+    When a schema is given, returns the first object whose fields exist with the given
+    types (object: any type), skipping other values such as a "[3]" quoted in the prose.
+    Python literals outside strings, trailing commas and // comments are tolerated.
+    A value nested in another one is never returned on its own, so a truncated answer
+    fails instead of yielding one of its fields. Runs in linear time.
+    Raises ValueError when no matching value is found.
+    """
+    try:
+        # Fast path for outputs that are already plain JSON
+        value = json.loads(text, strict=False)
+    except (ValueError, RecursionError):
+        value = None
+    if isinstance(value, (dict, list)):
+        error = _json_schema_error(value, schema)
+        if error:
+            raise ValueError(error)
+        return value
+
+    # Rewrite the output as JSON tokens. A value may start at a bracket outside any other
+    # bracket, or at a bracket that follows prose rather than JSON, e.g. "[see {...}]"
+    out = []
+    prose = [0]  # running count of prose tokens in out
+    starts = []
+    closes = {}  # index in out of an opening bracket -> index of its closing bracket
+    stack = []   # (expected closing bracket, index of the opening bracket in out)
+    after_prose = False
+    for token in JSON_TOKEN_PATTERN.finditer(text):
+        token = token.group()
+        if token.startswith("//"):
+            continue
+        if token in JSON_CLOSING:
+            if not stack or after_prose:
+                starts.append(len(out))
+            stack.append((JSON_CLOSING[token], len(out)))
+        elif token in ("}", "]"):
+            # Drop trailing commas, also across whitespace and skipped comments
+            index = len(out) - 1
+            while index >= 0 and out[index][:1] not in ('"', "{", "[", "}", "]"):
+                stripped = out[index].rstrip(", \t\r\n")
+                out[index] = stripped
+                if stripped:
+                    break
+                index -= 1
+            if stack and stack[-1][0] == token:
+                closes[stack.pop()[1]] = len(out)
+            else:
+                stack = []
+        else:
+            token = JSON_LITERALS.get(token, token)
+        is_prose = not JSON_VALID_TOKEN_PATTERN.fullmatch(token)
+        out.append(token)
+        prose.append(prose[-1] + is_prose)
+        if token.strip():
+            after_prose = is_prose
+
+    offsets = [0]
+    for token in out:
+        offsets.append(offsets[-1] + len(token))
+    cleaned = "".join(out)
+
+    # A span holding prose is skipped without decoding. The spans that are decoded hold
+    # no prose, hence no other start, so they never overlap and the work stays linear.
+    error = None
+    for start in starts:
+        end = closes.get(start)
+        if end is None or prose[end + 1] != prose[start]:
+            continue
+        try:
+            value = JSON_DECODER.decode(cleaned[offsets[start]:offsets[end + 1]])
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        candidate_error = _json_schema_error(value, schema)
+        if candidate_error is None:
+            return value
+        error = error or candidate_error
+    raise ValueError(error or "No JSON value found in LLM output")
+
+
 # Custom exception classes for GenLayerDAO
 class DAOException(Exception):
     """Base exception class for GenLayerDAO"""
@@ -35,8 +145,11 @@ class Bounty:
         votes_for (int): Number of votes in favor of the bounty
         votes_against (int): Number of votes against the bounty
         status (str): Current status of the bounty ("proposed", "active", or "completed")
-        submissions (list): List of submissions for the bounty
-        vote_snapshot (dict): Snapshot of token balances at proposal time
+        submission_hashes (dict): Outcome of each submission by its hash, for duplicate detection
+        snapshot_epoch (int): Proposal epoch whose balances determine voting power
+        eligible_supply (int): Tokens held by all members at proposal time
+        quorum (int): Minimum number of voted tokens for the vote to be decided
+        votes_remaining (int): Eligible tokens that have not voted yet
         has_voted (dict): Tracks which users have voted on the bounty
     """
     def __init__(self, id: int, description: str, reward_description: str, proposer: str):
@@ -47,8 +160,12 @@ class Bounty:
         self.votes_for = 0
         self.votes_against = 0
         self.status = "proposed"  # Can be "proposed", "active", or "completed"
-        self.submissions: list[dict[str, str | bool]] = []
-        self.vote_snapshot: dict[str, int] = {}  # Snapshot of token balances at proposal time
+        # Only hashes and outcomes are kept, not the submitted text
+        self.submission_hashes: dict[str, dict[str, str | bool | int]] = {}
+        self.snapshot_epoch = 0  # Voting power is read from balance checkpoints at this epoch
+        self.eligible_supply = 0
+        self.quorum = 0
+        self.votes_remaining = 0
         self.has_voted: dict[str, bool] = {}  # Track who has voted
 
 class GenLayerDAO(IContract):
@@ -61,14 +178,26 @@ class GenLayerDAO(IContract):
         balances (dict): Mapping of addresses to token balances
         bounties (dict): Mapping of bounty IDs to Bounty objects
         next_bounty_id (int): ID to be assigned to the next proposed bounty
+        proposal_epoch (int): Epoch of the next proposal, incremented on every proposal
+        balance_checkpoints (dict): Mapping of addresses to (epoch, balance) pairs, in epoch order
         constitution (list): List of rules governing the DAO
+        constitution_version (int): Version of the constitution, incremented whenever it changes
+        constitution_hash (str): SHA-256 hash of the serialized constitution
+        constitution_prefix (str): Prompt prefix shared by every LLM call, built once per version
+        prompt_stats (dict): Per-call counters of estimated prompt tokens
     """
+
+    # Rejected submissions kept per bounty; beyond that the oldest are forgotten and can be evaluated again
+    MAX_REJECTED_SUBMISSIONS = 100
+
     def __init__(self):
         self.total_supply = 1000
         self.token_supply = self.total_supply
         self.balances: dict[str, int] = {}
         self.bounties: dict[int, Bounty] = {}
         self.next_bounty_id = 1
+        self.proposal_epoch = 0
+        self.balance_checkpoints: dict[str, list[tuple[int, int]]] = {}
 
         # Define the constitution of the DAO
         self.constitution = [
@@ -94,6 +223,34 @@ class GenLayerDAO(IContract):
             "A user does not have to be a member of the DAO or hold any DAO tokens to claim the bounty",
         ]
 
+        self.constitution_version = 0
+        self.constitution_hash = ""
+        self.constitution_prefix = ""
+        self.prompt_stats: dict[str, dict[str, int]] = {}
+        self._refresh_constitution_prefix()
+
+    def _refresh_constitution_prefix(self):
+        """
+        Rebuilds the prompt prefix if the constitution changed since it was last built.
+
+        The prefix is identical for every LLM call of a constitution version, so
+        backends with prefix caching (e.g. ollama) can reuse it across prompts.
+        Must be called after any change to the constitution.
+        """
+        serialized = json.dumps(self.constitution)
+        constitution_hash = hashlib.sha256(serialized.encode()).hexdigest()
+        if constitution_hash == self.constitution_hash:
+            return
+
+        self.constitution_version += 1
+        self.constitution_hash = constitution_hash
+        self.constitution_prefix = f"""You are GenLayerDAO.
+
+GenLayerDAO has a constitution (version {self.constitution_version}, hash {constitution_hash[:16]}):
+{serialized}
+
+"""
+
     async def propose_bounty(self, bounty_proposal: str) -> str:
         """
         Proposes a new bounty to the DAO.
@@ -112,44 +269,34 @@ class GenLayerDAO(IContract):
         if self.get_balance_of(proposer) == 0:
             raise InsufficientTokensException("Only DAO members can propose bounties.")
 
-        # Prepare prompt for LLM evaluation
-        prompt = f"""
-You are GenLayerDAO.
-
-GenLayerDAO has a constitution:
-{json.dumps(self.constitution)}
-
-A user with address "{proposer}" has proposed a new bounty:
-Description: {bounty_proposal}
-
-Evaluate if this bounty proposal adheres to the constitution.
-Respond with the following JSON format:
-{{
-"reasoning": str,
-"proposal_accepted": bool
-}}
-
-It is mandatory that you respond only using the JSON format above,
-nothing else. Don't include any other words or characters,
-your output must be only JSON without any formatting prefix or suffix.
-This result should be perfectly parseable by a JSON parser without errors.
-"""
-
-        result = await call_llm_with_principle(prompt, eq_principle="proposal_accepted has to match exactly.")
-        output = self._get_decode_json_resilient(result)
+        output = await self._evaluate_and_refine_proposal(proposer, bounty_proposal)
+        if output is None:
+            # Fall back to the two-step flow: constitution check, then refinement
+            output = await self._evaluate_proposal(proposer, bounty_proposal)
+            if output["proposal_accepted"]:
+                output["refined_description"], output["refined_reward"] = await self.refine_bounty_details(bounty_proposal)
 
         if output["proposal_accepted"]:
-            # Refine the bounty proposal
-            refined_description, refined_reward = await self.refine_bounty_details(bounty_proposal)        
+            refined_description = output["refined_description"]
+            refined_reward = output["refined_reward"]
 
             bounty = Bounty(self.next_bounty_id, refined_description, refined_reward, proposer)
-            bounty.vote_snapshot = self.balances.copy()
+            # Freeze voting power at the current epoch; later balance changes land in the next one
+            bounty.snapshot_epoch = self.proposal_epoch
+            self.proposal_epoch += 1
+            # Every token in circulation was votable at proposal time
+            bounty.eligible_supply = self.total_supply - self.token_supply
+            # One third, rounded up, and at least one token even when very few are in circulation
+            bounty.quorum = max(1, (bounty.eligible_supply + 2) // 3)
+            bounty.votes_remaining = bounty.eligible_supply
             self.bounties[self.next_bounty_id] = bounty
 
             # Automatically cast a vote for the proposer
             self._cast_vote(bounty, proposer, True)
             
             self.next_bounty_id += 1
+            if self._is_vote_decided(bounty):
+                return f"Bounty proposed successfully and automatically voted for. Bounty ID: {bounty.id}. {self._check_voting_result(bounty)}"
             return f"Bounty proposed successfully and automatically voted for. Bounty ID: {bounty.id}"
         else:
             raise DAOException(f"Bounty proposal rejected. Reason: {output['reasoning']}")
@@ -177,7 +324,7 @@ This result should be perfectly parseable by a JSON parser without errors.
         if bounty.status != "proposed":
             raise VotingException("This bounty is not in the voting phase.")
 
-        if voter not in bounty.vote_snapshot:
+        if self._get_balance_at(voter, bounty.snapshot_epoch) == 0:
             raise VotingException("You didn't hold any tokens when this bounty was proposed, so you can't vote on it.")
 
         if bounty.has_voted.get(voter, False):
@@ -196,15 +343,35 @@ This result should be perfectly parseable by a JSON parser without errors.
             voter (str): Address of the voter
             vote (bool): True for a positive vote, False for a negative vote
         """
-        voter_balance = bounty.vote_snapshot[voter]
+        voter_balance = self._get_balance_at(voter, bounty.snapshot_epoch)
 
         if vote:
             bounty.votes_for += voter_balance
         else:
             bounty.votes_against += voter_balance
+        bounty.votes_remaining = max(0, bounty.votes_remaining - voter_balance)
 
         bounty.has_voted[voter] = True
 
+    def _is_vote_decided(self, bounty: Bounty) -> bool:
+        """
+        Checks whether the outcome of a vote can no longer change.
+
+        A vote is decided once quorum is reached, or earlier when the votes that
+        are still outstanding can't change the majority.
+
+        Args:
+            bounty (Bounty): The bounty to check
+
+        Returns:
+            bool: True if the vote can be finalized
+        """
+        if bounty.votes_for + bounty.votes_against >= bounty.quorum:
+            return True
+        if bounty.votes_for > bounty.votes_against + bounty.votes_remaining:
+            return True
+        return bounty.votes_against >= bounty.votes_for + bounty.votes_remaining
+
     def _check_voting_result(self, bounty: Bounty) -> str:
         """
         Checks the voting result for a bounty and updates its status if necessary.
@@ -215,8 +382,7 @@ This result should be perfectly parseable by a JSON parser without errors.
         Returns:
             str: Message indicating the result of the check
         """
-        total_votes = bounty.votes_for + bounty.votes_against
-        if total_votes >= self.total_supply // 3:
+        if self._is_vote_decided(bounty):
             if bounty.votes_for > bounty.votes_against:
                 bounty.status = "active"
                 return f"Bounty {bounty.id} has been approved and is now active."
@@ -226,6 +392,95 @@ This result should be perfectly parseable by a JSON parser without errors.
 
         return f"Vote recorded for bounty {bounty.id}."
 
+    async def _evaluate_and_refine_proposal(self, proposer: str, bounty_proposal: str) -> dict | None:
+        """
+        Checks a bounty proposal against the constitution and refines it in a single LLM round.
+
+        Args:
+            proposer (str): Address of the user proposing the bounty
+            bounty_proposal (str): Original bounty proposal
+
+        Returns:
+            dict | None: The reasoning, acceptance and refined details, or None if the
+            response couldn't be used and the two-step flow has to be run instead
+        """
+        prompt = f"""A user with address "{proposer}" has proposed a new bounty:
+Description: {bounty_proposal}
+
+First, evaluate if this bounty proposal adheres to the constitution.
+
+If it does, improve and structure the proposal by:
+1. Separating the description and reward information.
+2. Ensuring the description is clear, concise, and specifies concrete deliverables or success criteria.
+3. Aligning it with GenLayerDAO's goals (increasing brand awareness, code contributions, application development, or community building).
+4. Adding any relevant technical details or requirements.
+5. Clarifying and standardizing the reward description, ensuring it's fair and motivating.
+
+The refined description should be a single, well-formatted paragraph.
+The refined reward should be clear and specific, potentially including conditions or tiers if appropriate.
+If the proposal is rejected, use empty strings for the refined fields.
+
+Respond with the following JSON format:
+{{
+"reasoning": str,
+"proposal_accepted": bool,
+"refined_description": str,
+"refined_reward": str
+}}
+
+It is mandatory that you respond only using the JSON format above,
+nothing else. Don't include any other words or characters,
+your output must be only JSON without any formatting prefix or suffix.
+This result should be perfectly parseable by a JSON parser without errors.
+"""
+
+        result = await self._call_llm(
+            "evaluate_and_refine_proposal",
+            prompt,
+            eq_principle="proposal_accepted has to match exactly. refined_description and refined_reward only have to capture the essence of the original proposal.",
+        )
+        try:
+            output = extract_json(result, {"proposal_accepted": bool})
+        except ValueError:
+            return None
+
+        if output["proposal_accepted"] and not (
+            output.get("refined_description") and output.get("refined_reward")
+        ):
+            return None
+        output.setdefault("reasoning", "")
+        return output
+
+    async def _evaluate_proposal(self, proposer: str, bounty_proposal: str) -> dict:
+        """
+        Checks a bounty proposal against the constitution using an LLM.
+
+        Args:
+            proposer (str): Address of the user proposing the bounty
+            bounty_proposal (str): Original bounty proposal
+
+        Returns:
+            dict: The reasoning and whether the proposal was accepted
+        """
+        prompt = f"""A user with address "{proposer}" has proposed a new bounty:
+Description: {bounty_proposal}
+
+Evaluate if this bounty proposal adheres to the constitution.
+Respond with the following JSON format:
+{{
+"reasoning": str,
+"proposal_accepted": bool
+}}
+
+It is mandatory that you respond only using the JSON format above,
+nothing else. Don't include any other words or characters,
+your output must be only JSON without any formatting prefix or suffix.
+This result should be perfectly parseable by a JSON parser without errors.
+"""
+
+        result = await self._call_llm("evaluate_proposal", prompt, eq_principle="proposal_accepted has to match exactly.")
+        return extract_json(result, {"reasoning": str, "proposal_accepted": bool})
+
     async def refine_bounty_details(self, bounty_proposal: str) -> tuple[str, str]:
         """
         Refines the bounty proposal using an LLM.
@@ -236,8 +491,7 @@ This result should be perfectly parseable by a JSON parser without errors.
         Returns:
             tuple: Refined description and reward description
         """
-        prompt = f"""
-You are an LLM helping to refine and standardize bounty proposals for GenLayerDAO. 
+        prompt = f"""You are helping to refine and standardize bounty proposals for GenLayerDAO.
 The original bounty proposal is: "{bounty_proposal}"
 
 Please improve and structure this proposal by:
@@ -262,9 +516,9 @@ your output must be only JSON without any formatting prefix or suffix.
 This result should be perfectly parseable by a JSON parser without errors.
 """
 
-        result = await call_llm_with_principle(prompt, eq_principle="The refined details should capture the essence of the original proposal.", comparative=False)
+        result = await self._call_llm("refine_bounty_details", prompt, eq_principle="The refined details should capture the essence of the original proposal.", comparative=False)
         print(result)
-        output = self._get_decode_json_resilient(result)
+        output = extract_json(result, {"refined_description": str, "refined_reward": str})
         return output["refined_description"], output["refined_reward"]
 
     async def compute_reward(self, bounty_id: int, submission: str) -> int:
@@ -285,8 +539,7 @@ This result should be perfectly parseable by a JSON parser without errors.
             raise InvalidBountyException("Invalid bounty ID")
 
         bounty = self.bounties[bounty_id]
-        prompt = f"""
-You are the GenLayerDAO reward calculator. Your task is to determine the appropriate reward for a bounty submission based on the bounty description, reward description, and the actual submission.
+        prompt = f"""You are now acting as the GenLayerDAO reward calculator. Your task is to determine the appropriate reward for a bounty submission based on the bounty description, reward description, and the actual submission.
 
 Bounty Description: {bounty.description}
 Reward Description: {bounty.reward_description}
@@ -308,8 +561,8 @@ your output must be only JSON without any formatting prefix or suffix.
 This result should be perfectly parseable by a JSON parser without errors.
 """
 
-        result = await call_llm_with_principle(prompt, eq_principle="The proposed reward should match exactly.")
-        output = self._get_decode_json_resilient(result)
+        result = await self._call_llm("compute_reward", prompt, eq_principle="The proposed reward should match exactly.")
+        output = extract_json(result, {"reward_amount": int})
         return min(output["reward_amount"], self.total_supply)  # Ensure reward doesn't exceed total supply
 
     async def claim_bounty(self, bounty_id: int, submission: str) -> str:
@@ -326,7 +579,7 @@ This result should be perfectly parseable by a JSON parser without errors.
         Raises:
             InvalidBountyException: If the bounty ID is invalid or the bounty is not active
             InsufficientTokensException: If there are not enough tokens to pay the reward
-            DAOException: If the submission is rejected
+            DAOException: If the same submission has already been made for the bounty
         """
         submitter = contract_runner.from_address
         if bounty_id not in self.bounties:
@@ -339,43 +592,68 @@ This result should be perfectly parseable by a JSON parser without errors.
         if bounty.status == "completed":
             raise InvalidBountyException("This bounty has already been completed.")
 
-        prompt = f"""
-You are GenLayerDAO.
+        submission_hash = self._hash_submission(submission)
+        if submission_hash in bounty.submission_hashes:
+            raise DAOException(f"This submission has already been made for bounty {bounty_id}.")
 
-A submission has been made for bounty {bounty_id}:
+        prompt = f"""A submission has been made for bounty {bounty_id}:
 Description: {bounty.description}
 Reward: {bounty.reward_description}
 Submission: {submission}
 
 Evaluate if this submission satisfactorily completes the bounty.
+If it does, determine the appropriate reward based on the reward description,
+considering factors such as completeness, quality, and impact of the submission.
+
 Respond with the following JSON format:
 {{
 "reasoning": str,
-"submission_accepted": bool
+"submission_accepted": bool,
+"reward_amount": int
 }}
 
+The reward_amount should be a whole number of tokens, not exceeding the total supply of {self.total_supply}.
+If the submission is rejected, the reward_amount should be 0.
+
 It is mandatory that you respond only using the JSON format above,
 nothing else. Don't include any other words or characters,
 your output must be only JSON without any formatting prefix or suffix.
 This result should be perfectly parseable by a JSON parser without errors.
 """
 
-        result = await call_llm_with_principle(prompt, eq_principle="submission_accepted has to match exactly.")
-        output = self._get_decode_json_resilient(result)
+        result = await self._call_llm("claim_bounty", prompt, eq_principle="submission_accepted and reward_amount have to match exactly.")
+        output = extract_json(result, {"reasoning": str, "submission_accepted": bool, "reward_amount": int})
 
         if output["submission_accepted"]:
-            reward_amount = await self.compute_reward(bounty_id, submission)
+            reward_amount = min(output["reward_amount"], self.total_supply)  # Ensure reward doesn't exceed total supply
             if self.token_supply < reward_amount:
                 raise InsufficientTokensException(f"Submission accepted, but insufficient tokens to pay reward. Current supply: {self.token_supply}")
             
             self._send_tokens(reward_amount, submitter)
             bounty.status = "completed"
-            bounty.submissions.append({"submitter": submitter, "submission": submission, "accepted": True, "reward": reward_amount})
+            bounty.submission_hashes[submission_hash] = {"submitter": submitter, "accepted": True, "reward": reward_amount}
             return f"Bounty {bounty_id} completed. Reward of {reward_amount} tokens sent to {submitter}."
         else:
-            bounty.submissions.append({"submitter": submitter, "submission": submission, "accepted": False})
-            raise DAOException(f"Submission for bounty {bounty_id} rejected. Reason: {output['reasoning']}")
+            # Returned rather than raised, so the rejection and its hash are kept
+            # and the same submission is turned down without another evaluation
+            if len(bounty.submission_hashes) >= self.MAX_REJECTED_SUBMISSIONS:
+                # Only rejections are stored while the bounty is active, oldest first
+                del bounty.submission_hashes[next(iter(bounty.submission_hashes))]
+            bounty.submission_hashes[submission_hash] = {"submitter": submitter, "accepted": False}
+            return f"Submission for bounty {bounty_id} rejected. Reason: {output['reasoning']}"
+
+    def _hash_submission(self, submission: str) -> str:
+        """
+        Hash a submission, ignoring case and whitespace differences.
 
+        Args:
+            submission (str): Submitted work for a bounty
+
+        Returns:
+            str: The hex SHA-256 digest of the normalized submission
+        """
+        normalized = " ".join(submission.split()).casefold()
+        return hashlib.sha256(normalized.encode()).hexdigest()
 
     def buy_tokens(self, amount: int):
         """
@@ -409,6 +687,41 @@ This result should be perfectly parseable by a JSON parser without errors.
             raise InsufficientTokensException("Insufficient token supply")
         self.balances[holder] = self.balances.get(holder, 0) + amount
         self.token_supply -= amount
+        self._checkpoint_balance(holder)
+
+    def _checkpoint_balance(self, holder: str):
+        """
+        Internal method to record a holder's current balance at the current proposal epoch.
+
+        Only the last balance of an epoch is kept, so a holder has at most one
+        checkpoint per proposal.
+
+        Args:
+            holder (str): The address whose balance changed.
+        """
+        checkpoints = self.balance_checkpoints.setdefault(holder, [])
+        checkpoint = (self.proposal_epoch, self.balances[holder])
+        if checkpoints and checkpoints[-1][0] == self.proposal_epoch:
+            checkpoints[-1] = checkpoint
+        else:
+            checkpoints.append(checkpoint)
+
+    def _get_balance_at(self, holder: str, epoch: int) -> int:
+        """
+        Get the token balance a holder had when the proposal of the given epoch was made.
+
+        Args:
+            holder (str): The address to check the balance for.
+            epoch (int): The proposal epoch.
+
+        Returns:
+            int: The balance at that epoch, or 0 if the holder had no tokens yet.
+        """
+        checkpoints = self.balance_checkpoints.get(holder)
+        if not checkpoints:
+            return 0
+        index = bisect_right(checkpoints, (epoch, float("inf")))
+        return checkpoints[index - 1][1] if index else 0
 
     def get_balances(self) -> dict[str, int]:
         """
@@ -440,6 +753,31 @@ This result should be perfectly parseable by a JSON parser without errors.
         """
         return {id: bounty.__dict__ for id, bounty in self.bounties.items()}
 
+    def get_bounty_status(self, bounty_id: int) -> dict:
+        """
+        Get the status and vote tallies of a specific bounty.
+
+        Args:
+            bounty_id (int): The ID of the bounty to check.
+
+        Returns:
+            dict: The status, vote tallies, quorum and outstanding eligible tokens of the bounty.
+
+        Raises:
+            InvalidBountyException: If the bounty ID is invalid.
+        """
+        if bounty_id not in self.bounties:
+            raise InvalidBountyException("Invalid bounty ID")
+        bounty = self.bounties[bounty_id]
+        return {
+            "status": bounty.status,
+            "votes_for": bounty.votes_for,
+            "votes_against": bounty.votes_against,
+            "votes_remaining": bounty.votes_remaining,
+            "eligible_supply": bounty.eligible_supply,
+            "quorum": bounty.quorum,
+        }
+
     def get_bounty(self, bounty_id: int) -> dict:
         """
         Get details of a specific bounty.
@@ -457,33 +795,56 @@ This result should be perfectly parseable by a JSON parser without errors.
             return self.bounties[bounty_id].__dict__
         raise InvalidBountyException("Invalid bounty ID")
 
-    def _get_decode_json_resilient(self, s: str) -> dict:
+    async def _call_llm(self, call_name: str, prompt: str, eq_principle: str, comparative: bool = True) -> str:
         """
-        Decode a JSON string in a resilient manner.
+        Internal method to call the LLM with the constitution prefix prepended to the prompt.
 
         Args:
-            s (str): The JSON string to decode.
+            call_name (str): Name the prompt token counters are recorded under
+            prompt (str): The call-specific part of the prompt
+            eq_principle (str): The equivalence principle validators apply to the result
+            comparative (bool): Whether validators compare results with the leader's
 
         Returns:
-            dict: The decoded JSON object.
+            str: The raw LLM output
         """
-        # Clean the string and replace boolean literals
-        clean = self._get_extract_json_from_string(s).replace("True", "true").replace("False", "false")
-        return json.loads(clean)
-
-    def _get_extract_json_from_string(self, s: str) -> str:
+        stats = self.prompt_stats.setdefault(
+            call_name, {"calls": 0, "prompt_tokens": 0, "prefix_tokens": 0}
+        )
+        stats["calls"] += 1
+        stats["prompt_tokens"] += self._estimate_tokens(self.constitution_prefix) + self._estimate_tokens(prompt)
+        stats["prefix_tokens"] += self._estimate_tokens(self.constitution_prefix)
+
+        return await call_llm_with_principle(
+            self.constitution_prefix + prompt, eq_principle=eq_principle, comparative=comparative
+        )
+
+    def _estimate_tokens(self, text: str) -> int:
         """
-        Extract a JSON object from a string.
+        Estimate the number of tokens of a text, at roughly four characters per token.
 
         Args:
-            s (str): The string potentially containing a JSON object.
+            text (str): The text to estimate.
 
         Returns:
-            str: The extracted JSON string, or an empty string if no valid JSON is found.
+            int: The estimated token count.
         """
-        start_index = s.find('{')
-        end_index = s.rfind('}')
-        if start_index != -1 and end_index != -1 and start_index < end_index:
-            return s[start_index:end_index + 1]
-        else:
-            return ""
\ No newline at end of file
+        return (len(text) + 3) // 4
+
+    def get_prompt_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Get the estimated prompt tokens sent per LLM call type.
+
+        "prompt_tokens" is the full prompt size. "uncached_tokens" is what remains
+        to be processed when the backend reuses the cached constitution prefix.
+
+        Returns:
+            dict[str, dict[str, int]]: A dictionary mapping call names to token counters.
+        """
+        return {
+            name: {
+                **stats,
+                "uncached_tokens": stats["prompt_tokens"] - stats["prefix_tokens"],
+            }
+            for name, stats in self.prompt_stats.items()
+        }
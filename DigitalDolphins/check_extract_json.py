@@ -0,0 +1,97 @@
+"""
+Regression check for the extract_json helper carried by the contracts.
+
+Every contract is loaded by the simulator as a single file, so each one has its own
+copy of extract_json. This script checks that all copies are identical and runs
+them against extract_json_corpus.json, a corpus of malformed LLM outputs: code
+fences, prose around the answer, Python literals, trailing commas, comments and
+truncated answers.
+
+Only the helper is executed, so the simulator is not needed.
+
+Example usage:
+    python check_extract_json.py
+"""
+import ast
+import json
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract_json_corpus.json")
+CONTRACTS = [
+    "DeepThoughtCoders/adr_validator.py",
+    "DigitalDolphins/bounty-dao-v2.py",
+    "DigitalDolphins/pure-llm-dao-v1.py",
+    "Sirius-Cybernetics/identity-registry.gpy",
+    "dont-panic-developers/llm_erc721.py",
+    "infinite-improbability-engineers/flight-insurance-pool.py",
+    "infinite-improbability-engineers/flight-insurance.py",
+]
+HELPER_NAMES = {
+    "JSON_TOKEN_PATTERN", "JSON_CLOSING", "JSON_LITERALS", "JSON_VALID_TOKEN_PATTERN", "JSON_DECODER",
+    "_json_schema_error", "extract_json",
+}
+SCHEMA_TYPES = {"str": str, "bool": bool, "int": int, "list": list, "dict": dict, "object": object}
+
+
+def helper_source(path: str) -> str:
+    """
+    Returns the source of the extract_json helper block of a contract file.
+    """
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        source = f.read()
+    segments = []
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            name = node.name
+        elif isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+        else:
+            continue
+        if name in HELPER_NAMES:
+            segments.append(ast.get_source_segment(source, node))
+    return "\n\n".join(segments)
+
+
+def run_corpus(extract_json, corpus: list[dict]) -> list[str]:
+    failures = []
+    for case in corpus:
+        schema = case["schema"] and {field: SCHEMA_TYPES[name] for field, name in case["schema"].items()}
+        try:
+            value = extract_json(case["output"], schema)
+        except ValueError as e:
+            if not case.get("error"):
+                failures.append(f"{case['name']}: raised {e}")
+            continue
+        if case.get("error"):
+            failures.append(f"{case['name']}: expected an error, got {value!r}")
+        elif value != case["expected"]:
+            failures.append(f"{case['name']}: got {value!r}")
+    return failures
+
+
+def main() -> int:
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    sources = {path: helper_source(path) for path in CONTRACTS}
+    reference = sources[CONTRACTS[0]]
+    failed = False
+    for path, source in sources.items():
+        if source != reference:
+            print(f"{path}: extract_json differs from {CONTRACTS[0]}")
+            failed = True
+
+    namespace = {"json": json, "re": re}
+    exec(reference, namespace)
+    failures = run_corpus(namespace["extract_json"], corpus)
+    for failure in failures:
+        print(failure)
+    print(f"{len(corpus) - len(failures)}/{len(corpus)} corpus outputs handled as expected")
+    return 1 if failed or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
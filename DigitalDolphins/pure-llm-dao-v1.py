@@ -1,24 +1,147 @@
 import json
+import re
 from backend.node.genvm.icontract import IContract
 from backend.node.genvm.equivalence_principle import call_llm_with_principle
 
+# Strings, // comments, bare words, brackets and runs of anything else, in that order
+JSON_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|//[^\n]*|[A-Za-z_]\w*|[{}\[\]]|[^"{}\[\]/A-Za-z_]+|["/]')
+JSON_CLOSING = {"{": "}", "[": "]"}
+JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Tokens that can appear in JSON: strings, brackets, literals, exponents and runs of numbers and separators
+JSON_VALID_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]|true|false|null|[eE]\d*|(?:[\s,:]|[+-]?\d+(?:\.\d+)?(?![\d.]))*')
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+def _json_schema_error(value, schema: dict | None) -> str | None:
+    if schema is None:
+        return None
+    if not isinstance(value, dict):
+        return "LLM output is not a JSON object"
+    for field, expected in schema.items():
+        if field not in value:
+            return f"LLM output is missing '{field}'"
+        # bool is a subclass of int, but a boolean is never a valid number here
+        if expected is not object and (
+            not isinstance(value[field], expected)
+            or expected is int and isinstance(value[field], bool)
+        ):
+            return f"LLM output field '{field}' is not of type {expected.__name__}"
+    return None
+
+
+def extract_json(text: str, schema: dict | None = None):
+    """
+    Returns the first JSON object or array found in an LLM output.
+    When a schema is given, returns the first object whose fields exist with the given
+    types (object: any type), skipping other values such as a "[3]" quoted in the prose.
+    Python literals outside strings, trailing commas and // comments are tolerated.
+    A value nested in another one is never returned on its own, so a truncated answer
+    fails instead of yielding one of its fields. Runs in linear time.
+    Raises ValueError when no matching value is found.
+    """
+    try:
+        # Fast path for outputs that are already plain JSON
+        value = json.loads(text, strict=False)
+    except (ValueError, RecursionError):
+        value = None
+    if isinstance(value, (dict, list)):
+        error = _json_schema_error(value, schema)
+        if error:
+            raise ValueError(error)
+        return value
+
+    # Rewrite the output as JSON tokens. A value may start at a bracket outside any other
+    # bracket, or at a bracket that follows prose rather than JSON, e.g. "[see {...}]"
+    out = []
+    prose = [0]  # running count of prose tokens in out
+    starts = []
+    closes = {}  # index in out of an opening bracket -> index of its closing bracket
+    stack = []   # (expected closing bracket, index of the opening bracket in out)
+    after_prose = False
+    for token in JSON_TOKEN_PATTERN.finditer(text):
+        token = token.group()
+        if token.startswith("//"):
+            continue
+        if token in JSON_CLOSING:
+            if not stack or after_prose:
+                starts.append(len(out))
+            stack.append((JSON_CLOSING[token], len(out)))
+        elif token in ("}", "]"):
+            # Drop trailing commas, also across whitespace and skipped comments
+            index = len(out) - 1
+            while index >= 0 and out[index][:1] not in ('"', "{", "[", "}", "]"):
+                stripped = out[index].rstrip(", \t\r\n")
+                out[index] = stripped
+                if stripped:
+                    break
+                index -= 1
+            if stack and stack[-1][0] == token:
+                closes[stack.pop()[1]] = len(out)
+            else:
+                stack = []
+        else:
+            token = JSON_LITERALS.get(token, token)
+        is_prose = not JSON_VALID_TOKEN_PATTERN.fullmatch(token)
+        out.append(token)
+        prose.append(prose[-1] + is_prose)
+        if token.strip():
+            after_prose = is_prose
+
+    offsets = [0]
+    for token in out:
+        offsets.append(offsets[-1] + len(token))
+    cleaned = "".join(out)
+
+    # A span holding prose is skipped without decoding. The spans that are decoded hold
+    # no prose, hence no other start, so they never overlap and the work stays linear.
+    error = None
+    for start in starts:
+        end = closes.get(start)
+        if end is None or prose[end + 1] != prose[start]:
+            continue
+        try:
+            value = JSON_DECODER.decode(cleaned[offsets[start]:offsets[end + 1]])
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        candidate_error = _json_schema_error(value, schema)
+        if candidate_error is None:
+            return value
+        error = error or candidate_error
+    raise ValueError(error or "No JSON value found in LLM output")
+
+
+# Words of a motion or section name, matched when selecting the sections shown to the LLM
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
 
 class ConstitutionalDAO(IContract):
     """
     A Constitutional DAO that uses AI to interpret and execute motions.
     This DAO maintains a state and can update it based on user-submitted motions.
+
+    The state is kept as named sections. Each motion only shows the LLM the
+    constitution and the sections it mentions, and the LLM answers with a
+    JSON-patch-style list of operations that is validated and applied locally.
+
+    Motions can also be queued with submit_motion and evaluated in batches
+    with execute_pending, one LLM call per batch.
     """
 
+    PATCH_OPERATIONS = ("add", "replace", "remove")
+
     def __init__(self):
         """
         Initialize the ConstitutionalDAO with a basic constitution.
         """
-        self.state = json.dumps({
+        self.sections: dict[str, object] = {
             "constitution": [
                 "1. Anyone can become a member of the DAO",
                 "2. The constitution of the DAO can be updated by a unanimous vote"
             ]
-        })
+        }
+        self.motions: dict[int, dict] = {}  # Motion ID -> motion record and outcome
+        self.pending_motions: list[int] = []  # Queued motion IDs, in submission order
+        self.next_motion_id = 1
 
     async def execute_motion(self, motion: str) -> None:
         """
@@ -32,22 +155,34 @@ class ConstitutionalDAO(IContract):
         Returns:
             None
         """
+        relevant_sections = self._select_sections(motion)
+
         # Prepare the prompt for the language model
         prompt = f"""
 You are a constitutional DAO
 
-Your state is as follows:
-{self.state}
+Your state is split into sections. These are all the sections and their sizes:
+{json.dumps(self._section_index())}
+
+These are the sections relevant to the motion:
+{json.dumps({name: self.sections[name] for name in relevant_sections})}
 
 User with the address "{contract_runner.from_address}"
 has made the following motion:
 {motion}
 
-Decide how to proceed
+Decide how to proceed and describe the changes to the state as a list of
+JSON patch operations. Paths are JSON pointers whose first segment is the
+section name, for example "/members/-" appends to the "members" section and
+"/treasury" adds or replaces a whole section. Use an empty list to leave the
+state unchanged.
+
 Respond with the following JSON format:
 {{
 "reasoning": str,          // Your reasoning
-"updated_state": any,      // The new state of the DAO - can be any format
+"patch": [                 // Changes to the state
+    {{"op": "add" | "replace" | "remove", "path": str, "value": any}}
+]
 }}
 
 It is mandatory that you respond only using the JSON format above,
@@ -59,15 +194,397 @@ This result should be perfectly parseable by a JSON parser without errors.
         # Call the language model with the equivalence principle
         result = await call_llm_with_principle(
             prompt,
-            eq_principle="The updated state has to be essentially equivalent",
+            eq_principle="The patch has to make essentially equivalent changes to the state",
         )
 
-        # Clean up the result and parse it as JSON
-        result_clean = result.replace("True", "true").replace("False", "false")
-        output = json.loads(result_clean)
+        # Extract the JSON response from the result
+        output = extract_json(result, {"reasoning": str, "patch": list})
 
         # Update the DAO state
-        self.state = json.dumps(output["updated_state"])
+        updated, removed = self._apply_patch(output["patch"])
+        for name in removed:
+            del self.sections[name]
+        self.sections.update(updated)
+
+    def submit_motion(self, motion: str) -> int:
+        """
+        Queue a motion to be executed by a later execute_pending call.
+
+        Args:
+            motion (str): The motion proposed by a user.
+
+        Returns:
+            int: The ID of the queued motion.
+        """
+        motion_id = self.next_motion_id
+        self.next_motion_id += 1
+        self.motions[motion_id] = {
+            "id": motion_id,
+            "proposer": contract_runner.from_address,
+            "motion": motion,
+            "status": "pending",
+            "reasoning": "",
+        }
+        self.pending_motions.append(motion_id)
+        return motion_id
+
+    async def execute_pending(self, max_n: int) -> dict[int, str]:
+        """
+        Execute up to max_n queued motions with a single LLM call.
+
+        Motions are applied in submission order. A motion whose patch touches a
+        path already changed by an earlier motion of the same batch, or another
+        position of a list it changed, conflicts with it and stays queued to be
+        re-evaluated against the new state.
+
+        Args:
+            max_n (int): The maximum number of motions to evaluate.
+
+        Returns:
+            dict[int, str]: The status of each evaluated motion ("executed", "failed" or "pending").
+        """
+        if max_n <= 0:
+            raise ValueError("max_n must be a positive integer")
+        batch = [self.motions[motion_id] for motion_id in self.pending_motions[:max_n]]
+        if not batch:
+            return {}
+
+        relevant_sections = []
+        for record in batch:
+            for name in self._select_sections(record["motion"]):
+                if name not in relevant_sections:
+                    relevant_sections.append(name)
+        motions = [
+            {"motion_id": record["id"], "proposer": record["proposer"], "motion": record["motion"]}
+            for record in batch
+        ]
+
+        prompt = f"""
+You are a constitutional DAO
+
+Your state is split into sections. These are all the sections and their sizes:
+{json.dumps(self._section_index())}
+
+These are the sections relevant to the motions:
+{json.dumps({name: self.sections[name] for name in relevant_sections})}
+
+Users have made the following motions, in order:
+{json.dumps(motions)}
+
+Decide how to proceed with each motion independently, as if it was the only
+one, and describe its changes to the state as a list of JSON patch operations.
+Paths are JSON pointers whose first segment is the section name, for example
+"/members/-" appends to the "members" section and "/treasury" adds or replaces
+a whole section. Use an empty list to leave the state unchanged.
+
+Respond with the following JSON format:
+{{
+"results": [               // One entry per motion, in the same order
+    {{
+    "motion_id": int,
+    "reasoning": str,      // Your reasoning
+    "patch": [             // Changes to the state
+        {{"op": "add" | "replace" | "remove", "path": str, "value": any}}
+    ]
+    }}
+]
+}}
+
+It is mandatory that you respond only using the JSON format above,
+nothing else. Don't include any other words or characters,
+your output must be only JSON without any formatting prefix or suffix.
+This result should be perfectly parseable by a JSON parser without errors.
+        """
+
+        result = await call_llm_with_principle(
+            prompt,
+            eq_principle="The patch of each motion has to make essentially equivalent changes to the state",
+        )
+        output = extract_json(result, {"results": list})
+        results = {
+            item["motion_id"]: item
+            for item in output["results"]
+            if isinstance(item, dict) and "motion_id" in item
+        }
+
+        outcomes: dict[int, str] = {}
+        changed_paths: list[list[str]] = []
+        still_pending: list[int] = []
+        for record in batch:
+            item = results.get(record["id"])
+            patch = item.get("patch") if item else None
+            if not isinstance(patch, list):
+                # Not answered for this motion, try again in the next batch
+                still_pending.append(record["id"])
+                outcomes[record["id"]] = "pending"
+                continue
+
+            paths = [self._split_path(op.get("path")) for op in patch if isinstance(op, dict)]
+            if any(self._paths_conflict(a, b) for a in paths for b in changed_paths):
+                still_pending.append(record["id"])
+                outcomes[record["id"]] = "pending"
+                continue
+
+            record["reasoning"] = item.get("reasoning", "")
+            try:
+                updated, removed = self._apply_patch(patch)
+            except ValueError as e:
+                record["status"] = "failed"
+                record["reasoning"] = f"{record['reasoning']} (invalid patch: {e})".strip()
+            else:
+                for name in removed:
+                    del self.sections[name]
+                self.sections.update(updated)
+                changed_paths.extend(paths)
+                record["status"] = "executed"
+            outcomes[record["id"]] = record["status"]
+
+        self.pending_motions = still_pending + self.pending_motions[len(batch):]
+        return outcomes
+
+    def _split_path(self, path: object) -> list[str]:
+        """
+        Split a JSON pointer into its segments.
+
+        Args:
+            path (object): The JSON pointer.
+
+        Returns:
+            list[str]: The unescaped path segments, empty if the path is invalid.
+        """
+        if not isinstance(path, str) or not path.startswith("/"):
+            return []
+        return [key.replace("~1", "/").replace("~0", "~") for key in path[1:].split("/")]
+
+    def _paths_conflict(self, a: list[str], b: list[str]) -> bool:
+        """
+        Check whether two patch paths touch the same part of the state.
+
+        Paths conflict when one is a prefix of the other, or when they address
+        different positions of the same list: patches are written against the
+        state before the batch, and an earlier insert or removal shifts the
+        positions a later patch refers to. Two appends to the same list ("-")
+        don't conflict, since their order doesn't matter.
+
+        Args:
+            a (list[str]): The segments of the first path.
+            b (list[str]): The segments of the second path.
+
+        Returns:
+            bool: True if the paths conflict.
+        """
+        if not a or not b:
+            return False
+        if a == b and a[-1] == "-":
+            return False
+        for index, (key_a, key_b) in enumerate(zip(a, b)):
+            if key_a != key_b:
+                # Digit-only keys can also name dict entries, e.g. "/members/123",
+                # so the container itself decides. One that can't be found conflicts.
+                container = self._container_at(a[:index])
+                return container is None or isinstance(container, list)
+        return True
+
+    def _container_at(self, keys: list[str]) -> object:
+        """
+        Find the value of the state at a path.
+
+        Args:
+            keys (list[str]): The path segments, starting with the section name.
+
+        Returns:
+            object: The value, or None if the path doesn't resolve.
+        """
+        if not keys:
+            return self.sections
+        value = self.sections.get(keys[0])
+        try:
+            for key in keys[1:]:
+                value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, ValueError, TypeError):
+            return None
+        return value
+
+    def get_motion(self, motion_id: int) -> dict:
+        """
+        Get a queued or executed motion and its outcome.
+
+        Args:
+            motion_id (int): The ID of the motion.
+
+        Returns:
+            dict: The motion, its proposer, status and reasoning.
+        """
+        if motion_id not in self.motions:
+            raise ValueError("Invalid motion ID")
+        return self.motions[motion_id]
+
+    def get_pending_motions(self) -> list[int]:
+        """
+        Get the IDs of the queued motions, in execution order.
+
+        Returns:
+            list[int]: The pending motion IDs.
+        """
+        return self.pending_motions
+
+    def _select_sections(self, motion: str) -> list[str]:
+        """
+        Select the sections shown to the LLM for a motion: the constitution plus
+        every section whose name is mentioned in the motion.
+
+        Names are matched as whole words, ignoring case, underscores and plural
+        endings, so "member" selects "members" and "treasury balance" selects
+        "treasury_balance".
+
+        Args:
+            motion (str): The motion proposed by a user.
+
+        Returns:
+            list[str]: The names of the relevant sections.
+        """
+        text = " " + " ".join(self._words(motion)) + " "
+        selected = []
+        for name in self.sections:
+            words = self._words(name)
+            if name == "constitution" or words and " " + " ".join(words) + " " in text:
+                selected.append(name)
+        return selected
+
+    def _words(self, text: str) -> list[str]:
+        """
+        Split a text into lowercase words in their singular form.
+
+        Args:
+            text (str): A motion or a section name.
+
+        Returns:
+            list[str]: The words of the text.
+        """
+        words = []
+        for word in WORD_PATTERN.findall(text.lower()):
+            if len(word) > 3 and word.endswith("ies"):
+                word = word[:-3] + "y"
+            elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            words.append(word)
+        return words
+
+    def _section_index(self) -> dict[str, str]:
+        """
+        Describe every section by its type and size without its content.
+
+        Returns:
+            dict[str, str]: A dictionary mapping section names to short descriptions.
+        """
+        index = {}
+        for name, value in self.sections.items():
+            if isinstance(value, dict):
+                index[name] = f"object with {len(value)} keys"
+            elif isinstance(value, list):
+                index[name] = f"list with {len(value)} items"
+            else:
+                index[name] = type(value).__name__
+        return index
+
+    def _apply_patch(self, patch: list) -> tuple[dict[str, object], set[str]]:
+        """
+        Apply JSON patch operations to copies of the sections they touch.
+
+        Nothing is written to the state here, so an invalid operation leaves
+        the state untouched.
+
+        Args:
+            patch (list): The JSON patch operations returned by the LLM.
+
+        Returns:
+            tuple: The updated sections by name, and the names of the removed sections.
+
+        Raises:
+            ValueError: If an operation is malformed or its path doesn't resolve.
+        """
+        updated: dict[str, object] = {}
+        removed: set[str] = set()
+        for operation in patch:
+            if not isinstance(operation, dict) or operation.get("op") not in self.PATCH_OPERATIONS:
+                raise ValueError(f"Invalid patch operation: {operation}")
+            op = operation["op"]
+            path = operation.get("path", "")
+            if not isinstance(path, str) or not path.startswith("/"):
+                raise ValueError(f"Invalid patch path: {path}")
+            if op != "remove" and "value" not in operation:
+                raise ValueError(f"Patch operation without value: {operation}")
+
+            keys = self._split_path(path)
+            section = keys[0]
+
+            if len(keys) == 1:
+                # Whole-section operations
+                if op == "remove":
+                    if section == "constitution":
+                        raise ValueError("The constitution section can't be removed")
+                    if section not in self.sections and section not in updated:
+                        raise ValueError(f"Unknown section: {section}")
+                    updated.pop(section, None)
+                    if section in self.sections:
+                        # A section added earlier in the same patch only has to be dropped from updated
+                        removed.add(section)
+                else:
+                    if op == "replace" and section not in self.sections and section not in updated:
+                        raise ValueError(f"Unknown section: {section}")
+                    updated[section] = operation["value"]
+                    removed.discard(section)
+                continue
+
+            if section not in updated:
+                if section in removed or section not in self.sections:
+                    raise ValueError(f"Unknown section: {section}")
+                updated[section] = json.loads(json.dumps(self.sections[section]))
+
+            parent = updated[section]
+            try:
+                for key in keys[1:-1]:
+                    parent = parent[int(key)] if isinstance(parent, list) else parent[key]
+            except (KeyError, IndexError, ValueError, TypeError):
+                raise ValueError(f"Invalid patch path: {path}")
+            self._apply_operation(parent, keys[-1], op, operation.get("value"))
+
+        return updated, removed
+
+    def _apply_operation(self, parent: object, key: str, op: str, value: object) -> None:
+        """
+        Apply a single add, replace or remove operation on a container.
+
+        Args:
+            parent (object): The list or dict that holds the target.
+            key (str): The last path segment, "-" meaning the end of a list.
+            op (str): The operation.
+            value (object): The value to add or replace with.
+
+        Raises:
+            ValueError: If the target doesn't exist or the key is invalid.
+        """
+        if isinstance(parent, list):
+            if op == "add" and key == "-":
+                parent.append(value)
+                return
+            if not key.isdigit() or int(key) > len(parent) or (op != "add" and int(key) == len(parent)):
+                raise ValueError(f"Invalid list index: {key}")
+            if op == "add":
+                parent.insert(int(key), value)
+            elif op == "replace":
+                parent[int(key)] = value
+            else:
+                del parent[int(key)]
+        elif isinstance(parent, dict):
+            if op != "add" and key not in parent:
+                raise ValueError(f"Unknown key: {key}")
+            if op == "remove":
+                del parent[key]
+            else:
+                parent[key] = value
+        else:
+            raise ValueError(f"Can't apply {op} inside a {type(parent).__name__}")
 
     def get_state(self) -> str:
         """
@@ -76,4 +593,16 @@ This result should be perfectly parseable by a JSON parser without errors.
         Returns:
             str: The current state of the DAO as a JSON string.
         """
-        return self.state
\ No newline at end of file
+        return json.dumps(self.sections)
+
+    def get_section(self, name: str) -> object:
+        """
+        Get a single section of the DAO state.
+
+        Args:
+            name (str): The name of the section.
+
+        Returns:
+            object: The content of the section, or None if it doesn't exist.
+        """
+        return self.sections.get(name)
@@ -0,0 +1,275 @@
+"""
+Benchmark for the ImageDataManipulator contract in multi-modal-image-processing.gpy.
+
+The contract is executed outside the simulator, with its genvm, web3 and requests
+imports stubbed. Pillow must be installed.
+
+Scenarios:
+    routing  Routing decisions against simulated model backends with set latencies and
+             failure rates: the models picked by each routing mode, the latency and
+             failures the requests see, and the cost of a select_llm call.
+    nonce    Chainlink request throughput against an in-process test chain that mines
+             the pending transactions of each block: blocking call_chainlink_function
+             calls one after another, and process_images with every request in flight.
+
+Example usage:
+    python bench_image_processor.py routing --requests 2000
+    python bench_image_processor.py nonce --requests 40 --block-ms 200 --rpc-ms 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+import timeit
+import types
+
+CONTRACT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "multi-modal-image-processing.gpy")
+
+# Simulated backends: model -> (mean latency in seconds, failure rate). Latencies vary by +-20%.
+BACKENDS = {
+    "chatgpt-3-turbo": (0.3, 0.02),
+    "gpt-4": (1.2, 0.01),
+    "llama-2": (0.6, 0.25),
+}
+ROUTING_MODES = [("quality", 0), ("latency", 0), ("latency", 8)]
+
+
+class TransactionNotFound(Exception):
+    pass
+
+
+class TestChain:
+    """
+    In-process stand-in for the web3 eth API of one account. Transactions are mined in blocks of
+    block_time seconds, once every lower nonce has been sent, so they may arrive out of order.
+    Every RPC call takes rpc_time seconds.
+    """
+    def __init__(self, block_time: float, rpc_time: float):
+        self.block_time = block_time
+        self.rpc_time = rpc_time
+        self.start = time.monotonic()
+        self.sent = {}  # nonce -> send time
+        self.lock = threading.Lock()
+        self.rpc_calls = 0
+        self.account = types.SimpleNamespace(
+            sign_transaction=lambda transaction, private_key: types.SimpleNamespace(rawTransaction=transaction)
+        )
+
+    def _rpc(self):
+        with self.lock:
+            self.rpc_calls += 1
+        time.sleep(self.rpc_time)
+
+    def _block(self, moment: float) -> int:
+        return int((moment - self.start) / self.block_time)
+
+    def getTransactionCount(self, address: str, block_identifier: str = "latest") -> int:
+        self._rpc()
+        with self.lock:
+            if block_identifier == "pending":
+                return len(self.sent)
+            return sum(self._is_mined(nonce) for nonce in self.sent)
+
+    def sendRawTransaction(self, transaction: dict) -> bytes:
+        self._rpc()
+        nonce = transaction["nonce"]
+        with self.lock:
+            if nonce in self.sent:
+                raise ValueError(f"nonce {nonce} already used")
+            self.sent[nonce] = time.monotonic()
+        return str(nonce).encode()
+
+    def _is_mined(self, nonce: int) -> bool:
+        # A transaction waits for every lower nonce, and is mined in the block after the last of them
+        if any(lower not in self.sent for lower in range(nonce)):
+            return False
+        ready = max(self.sent[lower] for lower in range(nonce + 1))
+        return self._block(time.monotonic()) > self._block(ready)
+
+    def getTransactionReceipt(self, tx_hash: str) -> dict:
+        self._rpc()
+        nonce = int(bytes.fromhex(tx_hash).decode())
+        with self.lock:
+            if not self._is_mined(nonce):
+                raise TransactionNotFound(tx_hash)
+        return {"nonce": nonce}
+
+    def waitForTransactionReceipt(self, tx_hash: bytes) -> dict:
+        while True:
+            try:
+                return self.getTransactionReceipt(tx_hash.hex())
+            except TransactionNotFound:
+                time.sleep(self.block_time / 4)
+
+
+def web3_module() -> types.ModuleType:
+    """
+    A web3 module stub with the Web3 helpers the contract uses.
+    """
+    web3 = types.ModuleType("web3")
+    web3.Web3 = types.SimpleNamespace(
+        toHex=lambda value: value.hex(),
+        toWei=lambda value, unit: 0,
+        toBytes=lambda text: text.encode(),
+    )
+    web3.TransactionNotFound = TransactionNotFound
+    return web3
+
+
+def load_contract(web3: types.ModuleType | None = None) -> dict:
+    """
+    Executes the contract source with stubbed genvm, web3 and requests modules and returns its namespace.
+    """
+    icontract = types.ModuleType("backend.node.genvm.icontract")
+    icontract.IContract = object
+    if web3 is None:
+        web3 = types.ModuleType("web3")
+        web3.Web3 = None
+    web3_exceptions = types.ModuleType("web3.exceptions")
+    web3_exceptions.TransactionNotFound = getattr(web3, "TransactionNotFound", LookupError)
+    sys.modules["backend.node.genvm.icontract"] = icontract
+    sys.modules["web3"] = web3
+    sys.modules["web3.exceptions"] = web3_exceptions
+    sys.modules.setdefault("requests", types.ModuleType("requests"))
+
+    with open(CONTRACT, encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": "multi_modal_image_processing"}
+    exec(compile(source, CONTRACT, "exec"), namespace)
+    return namespace
+
+
+def new_manipulator(contract: dict, transformation_type: str):
+    """
+    Creates an ImageDataManipulator without running __init__, which connects to a web3 provider,
+    and sets the attributes the benchmarks use.
+    """
+    manipulator = contract["ImageDataManipulator"].__new__(contract["ImageDataManipulator"])
+    manipulator.transformation_type = transformation_type
+    manipulator.transformation_params = {}
+    manipulator.routing_mode = "quality"
+    manipulator.quality_floor = 0
+    manipulator.model_stats = {}
+    return manipulator
+
+
+def new_requester(contract: dict, chain: TestChain, poll_interval: float):
+    """
+    Creates an ImageDataManipulator that sends its Chainlink requests to the test chain.
+    """
+    manipulator = new_manipulator(contract, "overlay_text")
+    manipulator.web3 = types.SimpleNamespace(eth=chain, toHex=lambda value: value.hex(), toWei=lambda value, unit: 0)
+    manipulator.account = types.SimpleNamespace(address="0x0")
+    manipulator.private_key = None
+    request = types.SimpleNamespace(buildTransaction=lambda transaction: transaction)
+    manipulator.contract = types.SimpleNamespace(
+        functions=types.SimpleNamespace(sendImageProcessingRequest=lambda *args: request)
+    )
+    # The contract leaves reading the result from the receipt to be implemented
+    manipulator.check_result = lambda receipt: receipt["nonce"]
+    manipulator.nonce_lock = asyncio.Lock()
+    manipulator.next_nonce = None
+    manipulator.pending_receipts = {}
+    manipulator.receipt_poller = None
+    manipulator.receipt_poll_interval = poll_interval
+    return manipulator
+
+
+def bench_nonce(contract: dict, requests: int, block_time: float, rpc_time: float) -> list[dict]:
+    images = [bytearray(f"image {i}".encode()) for i in range(requests)]
+    rows = []
+    for mode in ("blocking", "async"):
+        chain = TestChain(block_time, rpc_time)
+        manipulator = new_requester(contract, chain, block_time / 4)
+        start = time.perf_counter()
+        # The request path prints every transaction hash and receipt
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == "blocking":
+                results = [
+                    manipulator.call_chainlink_function({"image_data": image, "transformation_type": "overlay_text", "llm": "gpt-4"})
+                    for image in images
+                ]
+            else:
+                results = asyncio.run(manipulator.process_images(images))
+        elapsed = time.perf_counter() - start
+        if sorted(chain.sent) != list(range(requests)) or sorted(results) != list(range(requests)):
+            raise RuntimeError(f"{mode}: nonces or results are not one per request")
+        rows.append({"mode": mode, "elapsed": elapsed, "rpc_calls": chain.rpc_calls})
+    return rows
+
+
+def bench_routing(contract: dict, transformation_type: str, routing_mode: str, quality_floor: int, requests: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    manipulator = new_manipulator(contract, transformation_type)
+    manipulator.set_routing_mode(routing_mode, quality_floor)
+    picks = dict.fromkeys(BACKENDS, 0)
+    total_latency = 0.0
+    failures = 0
+    for _ in range(requests):
+        llm_name = manipulator.select_llm()
+        mean_latency, failure_rate = BACKENDS[llm_name]
+        latency = mean_latency * rng.uniform(0.8, 1.2)
+        success = rng.random() >= failure_rate
+        manipulator.record_model_call(llm_name, latency, success)
+        picks[llm_name] += 1
+        total_latency += latency
+        failures += not success
+    return {
+        "mode": f"{routing_mode}/{quality_floor}",
+        "picks": picks,
+        "mean_latency": total_latency / requests,
+        "failure_rate": failures / requests,
+        # Time spent per successful request, counting the failed calls before it
+        "latency_per_success": total_latency / max(requests - failures, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+    routing = subparsers.add_parser("routing", help="routing modes against simulated model backends")
+    routing.add_argument("--requests", type=int, default=2000)
+    routing.add_argument("--transformation", default="crop")
+    routing.add_argument("--seed", type=int, default=1)
+    nonce = subparsers.add_parser("nonce", help="blocking and async Chainlink requests against a test chain")
+    nonce.add_argument("--requests", type=int, default=40)
+    nonce.add_argument("--block-ms", type=float, default=200, help="block time of the test chain")
+    nonce.add_argument("--rpc-ms", type=float, default=5, help="latency of every RPC call")
+    args = parser.parse_args()
+
+    if args.scenario == "routing":
+        contract = load_contract()
+        print(f"{args.requests} '{args.transformation}' requests, simulated backends (mean latency s, failure rate): {BACKENDS}")
+        names = list(BACKENDS)
+        print(f"{'mode':>10} " + " ".join(f"{name:>16}" for name in names) + f" {'mean s':>7} {'failures':>9} {'s/success':>10}")
+        for routing_mode, quality_floor in ROUTING_MODES:
+            row = bench_routing(contract, args.transformation, routing_mode, quality_floor, args.requests, args.seed)
+            print(
+                f"{row['mode']:>10} " + " ".join(f"{row['picks'][name]:>16}" for name in names)
+                + f" {row['mean_latency']:>7.3f} {row['failure_rate']:>9.1%} {row['latency_per_success']:>10.3f}"
+            )
+
+        manipulator = new_manipulator(contract, args.transformation)
+        llm_list = contract["ImageDataManipulator"].LLM_LIST
+        table_time = timeit.timeit(manipulator.select_llm, number=100000) / 100000
+        # The selection select_llm made before the routing table: a scan of LLM_LIST by static score only
+        scan_time = timeit.timeit(
+            lambda: max(llm_list, key=lambda llm: llm[1].get(args.transformation, 0))[0], number=100000
+        ) / 100000
+        print(f"\nselect_llm: {table_time * 1_000_000:.2f} us with the routing table, {scan_time * 1_000_000:.2f} us for a static-score scan of LLM_LIST")
+    elif args.scenario == "nonce":
+        contract = load_contract(web3_module())
+        print(f"{args.requests} requests, {args.block_ms:.0f} ms blocks, {args.rpc_ms:.0f} ms per RPC call")
+        print(f"{'mode':>9} {'seconds':>8} {'requests/s':>11} {'RPC calls':>10}")
+        for row in bench_nonce(contract, args.requests, args.block_ms / 1000, args.rpc_ms / 1000):
+            print(f"{row['mode']:>9} {row['elapsed']:>8.2f} {args.requests / row['elapsed']:>11.1f} {row['rpc_calls']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
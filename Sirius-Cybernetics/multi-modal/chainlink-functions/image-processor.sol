@@ -43,6 +43,33 @@ contract ImageProcessor is FunctionsClient, ConfirmedOwner {
         return s_lastRequestId;
     }
 
+    function sendImageProcessingRequest(
+        string memory imageData,
+        string memory transformationType,
+        string memory llm,
+        uint64 subscriptionId,
+        uint32 gasLimit,
+        bytes32 donID
+    ) external onlyOwner returns (bytes32 requestId) {
+        FunctionsRequest.Request memory req;
+        req.initializeRequestForInlineJavaScript(jsSourceCode);
+        // Same order as the args read by llm_process.js, imageData is base64 encoded
+        string[] memory args = new string[](4);
+        args[0] = "";
+        args[1] = transformationType;
+        args[2] = llm;
+        args[3] = imageData;
+        req.setArgs(args);
+
+        s_lastRequestId = _sendRequest(
+            req.encodeCBOR(),
+            subscriptionId,
+            gasLimit,
+            donID
+        );
+        return s_lastRequestId;
+    }
+
     function fulfillRequest(
         bytes32 requestId,
         bytes memory response,
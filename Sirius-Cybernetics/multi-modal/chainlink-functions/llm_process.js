@@ -3,6 +3,7 @@
 const prompt = args[0];
 const transformationType = args[1];
 const selectedLLM = args[2];
+// The image bytes are base64 encoded, since request arguments are strings
 const imageData = args[3];
 
 if (
@@ -0,0 +1,132 @@
+"""
+Web-request benchmark harness for the hackathon contracts.
+
+Replays, against the record/replay server, the page fetches that each contract
+entry point performs through `get_webpage`, and reports per-method latency and
+throughput. Fetches a method issues one after another are replayed one after
+another, fetches it gathers concurrently are replayed concurrently.
+
+Only the web leg is measured: LLM calls and consensus rounds happen inside the
+simulator and are not part of these numbers.
+
+Example usage:
+    python server.py --latency-ms 150 --jitter-ms 50 &
+    python bench.py --server http://localhost:5000 --iterations 50 --concurrency 8
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+GITHUB_REPOSITORY = "cristiam86/genlayer-hackaton"
+GITHUB_USERNAME = "alice-dev"
+PULL = 1
+API_PULL = f"https://api.github.com/repos/{GITHUB_REPOSITORY}/pulls/{PULL}"
+CLAIM_MANY_PULLS = [1, 2, 3, 4]
+
+# Contract entry point -> fetch steps. Each step is a list of URLs fetched concurrently.
+SCENARIOS = {
+    "GitBounties.register": [
+        [f"https://github.com/{GITHUB_USERNAME}"],
+    ],
+    "GitBounties.claim": [
+        [API_PULL],
+        [API_PULL + "/reviews?per_page=100"],
+    ],
+    "GithubPayer.register": [
+        [f"https://github.com/{GITHUB_USERNAME}"],
+    ],
+    "GithubPayer.claim": [
+        [f"https://github.com/{GITHUB_REPOSITORY}/pull/{PULL}"],
+        [API_PULL],
+    ],
+    # claim_many gathers the API pages of all its pulls at once
+    "GithubPayer.claim_many": [
+        [f"https://api.github.com/repos/{GITHUB_REPOSITORY}/pulls/{pull}" for pull in CLAIM_MANY_PULLS],
+    ],
+    "FlightInsurance.ask_for_flight_status": [
+        ["https://flightaware.com/live/flight/TAP457/history/20240818/0510Z/LFPO/LPPR"],
+    ],
+    "TowelTechies.retrieve_market_data": [
+        ["https://coinmarketcap.com/currencies/bitcoin"],
+    ],
+    "IdentityVerifier.verify_identity": [
+        ["https://www.linkedin.com/in/john-doe"],
+    ],
+}
+
+
+def get_webpage(server: str, url: str) -> str:
+    request = urllib.request.Request(
+        server.rstrip("/") + "/api",
+        data=json.dumps({"jsonrpc": "2.0", "id": 1, "method": "get_webpage", "params": [url, "text"]}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        result = json.loads(response.read())["result"]
+    if result["status"] != "success":
+        raise RuntimeError(result["data"])
+    return result["data"]
+
+
+def run_entry_point(server: str, steps: list[list[str]], pool: ThreadPoolExecutor) -> float:
+    start = time.perf_counter()
+    for urls in steps:
+        if len(urls) == 1:
+            get_webpage(server, urls[0])
+        else:
+            list(pool.map(lambda url: get_webpage(server, url), urls))
+    return time.perf_counter() - start
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark(server: str, method: str, iterations: int, concurrency: int) -> dict:
+    steps = SCENARIOS[method]
+    with ThreadPoolExecutor(max_workers=concurrency) as callers, ThreadPoolExecutor(max_workers=8) as fetchers:
+        start = time.perf_counter()
+        latencies = list(callers.map(lambda _: run_entry_point(server, steps, fetchers), range(iterations)))
+        elapsed = time.perf_counter() - start
+    return {
+        "method": method,
+        "calls": iterations,
+        "fetches_per_call": sum(len(urls) for urls in steps),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "throughput_per_s": iterations / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark contract web requests against the replay server")
+    parser.add_argument("--server", default="http://localhost:5000")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--method", action="append", choices=sorted(SCENARIOS), help="only run these entry points")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [
+        benchmark(args.server, method, args.iterations, args.concurrency)
+        for method in (args.method or SCENARIOS)
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'method':40} {'calls':>6} {'fetches':>8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'calls/s':>9}")
+    for r in results:
+        print(
+            f"{r['method']:40} {r['calls']:>6} {r['fetches_per_call']:>8} {r['mean_ms']:>9.1f} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['throughput_per_s']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
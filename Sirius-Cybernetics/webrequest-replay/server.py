@@ -0,0 +1,175 @@
+"""
+Record/replay stand-in for the simulator's webrequest service.
+
+Serves saved pages from the fixtures directory so contracts that call
+`get_webpage` can run on machines without internet access. In record mode
+unknown URLs are fetched from the real site once and saved as new fixtures.
+
+Example usage:
+    python server.py --port 5000 --latency-ms 150 --jitter-ms 50 --host-latency flightaware.com=400
+    python server.py --record  # fetch and save pages that are not recorded yet
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture_path(fixtures_dir: str, url: str) -> str:
+    """
+    Returns the fixture file of a URL, named after the host and a hash of the full URL.
+    """
+    host = urlparse(url).netloc or "unknown"
+    digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return os.path.join(fixtures_dir, f"{host}-{digest}.json")
+
+
+class FixtureStore:
+    """
+    Saved pages indexed by URL, loaded once at startup.
+    """
+
+    def __init__(self, fixtures_dir: str, record: bool):
+        self.fixtures_dir = fixtures_dir
+        self.record = record
+        self.pages: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        for name in sorted(os.listdir(fixtures_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+                    page = json.load(f)
+                self.pages[page["url"]] = page
+
+    def get(self, url: str) -> dict | None:
+        page = self.pages.get(url)
+        if page is None and self.record:
+            page = self._record(url)
+        return page
+
+    def _record(self, url: str) -> dict:
+        request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            body = response.read().decode("utf-8", errors="replace")
+            page = {"url": url, "status": response.status, "body": body}
+        with self.lock:
+            with open(fixture_path(self.fixtures_dir, url), "w", encoding="utf-8") as f:
+                json.dump(page, f, indent=2)
+            self.pages[url] = page
+        return page
+
+
+class Latency:
+    """
+    Injected response latency: a base delay plus uniform jitter, overridable per host.
+    """
+
+    def __init__(self, latency_ms: float, jitter_ms: float, host_latency: dict[str, float]):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.host_latency = host_latency
+
+    def sleep(self, url: str) -> None:
+        host = urlparse(url).netloc
+        base = self.latency_ms
+        for suffix, value in self.host_latency.items():
+            if host == suffix or host.endswith("." + suffix):
+                base = value
+                break
+        delay = base + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    store: FixtureStore
+    latency: Latency
+
+    def do_GET(self):
+        # Plain GET access: /page?url=<url>
+        parsed = urlparse(self.path)
+        if parsed.path != "/page":
+            return self._send_json(404, {"error": "not found"})
+        url = parse_qs(parsed.query).get("url", [""])[0]
+        page = self._lookup(url)
+        if page is None:
+            return self._send_json(404, {"error": f"no fixture for {url}"})
+        self._send_json(200, {"status": "success", "data": page["body"]})
+
+    def do_POST(self):
+        # JSON-RPC access mirroring the webrequest service: get_webpage(url, mode)
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError:
+            return self._send_json(400, {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}})
+
+        request_id = request.get("id")
+        if request.get("method") != "get_webpage":
+            return self._send_json(200, {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32601, "message": "Method not found"}})
+
+        params = request.get("params", [])
+        url = params.get("url") if isinstance(params, dict) else params[0]
+        page = self._lookup(url)
+        if page is None:
+            result = {"status": "error", "data": f"no fixture for {url}"}
+        else:
+            result = {"status": "success", "data": page["body"]}
+        self._send_json(200, {"jsonrpc": "2.0", "id": request_id, "result": result})
+
+    def _lookup(self, url: str) -> dict | None:
+        self.latency.sleep(url)
+        try:
+            return self.store.get(url)
+        except OSError as e:
+            print(f"Error recording {url}: {e}")
+            return None
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_host_latency(values: list[str]) -> dict[str, float]:
+    host_latency = {}
+    for value in values:
+        host, _, ms = value.partition("=")
+        host_latency[host] = float(ms)
+    return host_latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for the webrequest service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WEBREQUESTPORT", 5000)))
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--record", action="store_true", help="fetch and save URLs that have no fixture")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--host-latency", action="append", default=[], metavar="HOST=MS")
+    args = parser.parse_args()
+
+    ReplayHandler.store = FixtureStore(args.fixtures, args.record)
+    ReplayHandler.latency = Latency(args.latency_ms, args.jitter_ms, parse_host_latency(args.host_latency))
+
+    server = ThreadingHTTPServer((args.host, args.port), ReplayHandler)
+    print(f"Serving {len(ReplayHandler.store.pages)} recorded pages on {args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
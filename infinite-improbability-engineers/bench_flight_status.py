@@ -0,0 +1,167 @@
+"""
+Latency and agreement benchmark for the flight status check of flight-insurance.py.
+
+Runs every saved FlightAware page of flightaware_corpus.json through the two paths of
+FlightInsurance.ask_for_flight_status: the page parser (parse_arrival_delay against
+the delay threshold) and the LLM prompt. Each verdict is compared with the label of
+the page, and so is the verdict the contract reaches by parsing first and asking the
+LLM only for pages the parser can't read.
+
+The contract is loaded outside the simulator with its genvm modules stubbed. By
+default the LLM is a stub that answers with the page label after --llm-ms, which
+measures the cost of the rounds the parser saves but not the LLM's agreement. Pass
+--ollama to send the prompts to an ollama server, e.g. the one of the simulator's
+docker-compose.
+
+Example usage:
+    python bench_flight_status.py --llm-ms 2000
+    python bench_flight_status.py --ollama http://localhost:11434 --model llama3
+"""
+import argparse
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import types
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONTRACT = os.path.join(HERE, "flight-insurance.py")
+CORPUS = os.path.join(HERE, "flightaware_corpus.json")
+
+
+class StubLLM:
+    """
+    Answers with the label of the page being classified, after a fixed delay.
+    """
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.label = False
+
+    async def __call__(self, prompt: str) -> str:
+        await asyncio.sleep(self.delay)
+        return json.dumps({"arrivalstatus": self.label})
+
+
+class OllamaLLM:
+    """
+    Sends prompts to the generate endpoint of an ollama server.
+    """
+    def __init__(self, url: str, model: str):
+        self.url = url.rstrip("/") + "/api/generate"
+        self.model = model
+        self.label = False
+
+    async def __call__(self, prompt: str) -> str:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"model": self.model, "prompt": prompt, "stream": False}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        response = await asyncio.to_thread(urllib.request.urlopen, request, timeout=300)
+        with response:
+            return json.load(response)["response"]
+
+
+def load_contract() -> dict:
+    """
+    Executes the contract source with stubbed genvm modules and returns its namespace.
+    """
+    icontract = types.ModuleType("backend.node.genvm.icontract")
+    icontract.IContract = object
+    equivalence_principle = types.ModuleType("backend.node.genvm.equivalence_principle")
+    equivalence_principle.EquivalencePrinciple = object
+    sys.modules["backend.node.genvm.icontract"] = icontract
+    sys.modules["backend.node.genvm.equivalence_principle"] = equivalence_principle
+    builtins.contract_runner = types.SimpleNamespace(from_address="0x0")
+
+    with open(CONTRACT, encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": "flight_insurance"}
+    exec(compile(source, CONTRACT, "exec"), namespace)
+    return namespace
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    # The contract prints the pages and LLM outputs it handles
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = function(*args)
+    return value, time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--llm-ms", type=float, default=2000, help="stub LLM latency per call")
+    parser.add_argument("--ollama", help="URL of an ollama server to use instead of the stub LLM")
+    parser.add_argument("--model", default="llama3", help="ollama model")
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+    llm = OllamaLLM(args.ollama, args.model) if args.ollama else StubLLM(args.llm_ms / 1000)
+    eq = types.SimpleNamespace(call_llm=llm)
+    contract = load_contract()
+    flight = contract["FlightInsurance"]("TAP457", "20240818", "0510Z", "LFPO", "LPPR", 35, 30)
+
+    rows = []
+    for case in corpus:
+        llm.label = case["delayed"]
+        parsed, parse_time = timed(flight._parse_flight_status, case["page"])
+        try:
+            answered, llm_time = timed(asyncio.run, flight._ask_llm_for_flight_status(eq, case["page"]))
+            llm_verdict = answered["arrivalstatus"]
+        except ValueError:
+            llm_verdict, llm_time = None, 0
+        parser_verdict = None if parsed is None else parsed["arrivalstatus"]
+        contract_verdict = llm_verdict if parser_verdict is None else parser_verdict
+        contract_time = parse_time + (llm_time if parser_verdict is None else 0)
+        rows.append({
+            "name": case["name"],
+            "expected": case["delayed"],
+            "parser": parser_verdict,
+            "llm": llm_verdict,
+            "contract": contract_verdict,
+            "parse_time": parse_time,
+            "llm_time": llm_time,
+            "contract_time": contract_time,
+        })
+
+    def verdict(value) -> str:
+        return "-" if value is None else "delayed" if value else "on time"
+
+    print(f"{'page':<30} {'expected':>8} {'parser':>8} {'llm':>8} {'parse us':>9} {'llm ms':>9}")
+    for row in rows:
+        print(
+            f"{row['name']:<30} {verdict(row['expected']):>8} {verdict(row['parser']):>8} {verdict(row['llm']):>8}"
+            f" {row['parse_time'] * 1_000_000:>9.1f} {row['llm_time'] * 1000:>9.1f}"
+        )
+
+    parsed = [row for row in rows if row["parser"] is not None]
+    print()
+    print(f"{'path':<22} {'answered':>9} {'agree':>6} {'LLM calls':>10} {'median ms':>10} {'total s':>8}")
+    paths = (
+        ("parser", "parser", "parse_time", 0),
+        ("llm", "llm", "llm_time", len(rows)),
+        ("parser + llm fallback", "contract", "contract_time", len(rows) - len(parsed)),
+    )
+    for path, key, time_key, calls in paths:
+        answered = [row for row in rows if row[key] is not None]
+        agree = sum(row[key] == row["expected"] for row in answered)
+        times = [row[time_key] for row in rows]
+        print(
+            f"{path:<22} {len(answered):>9} {agree:>6} {calls:>10}"
+            f" {statistics.median(times) * 1000:>10.3f} {sum(times):>8.2f}"
+        )
+    if not args.ollama:
+        print("\nThe stub LLM answers with the page labels, so its agreement is not measured.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import re
+from backend.node.genvm.icontract import IContract
+from backend.node.genvm.equivalence_principle import EquivalencePrinciple
+
+
+# Strings, // comments, bare words, brackets and runs of anything else, in that order
+JSON_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|//[^\n]*|[A-Za-z_]\w*|[{}\[\]]|[^"{}\[\]/A-Za-z_]+|["/]')
+JSON_CLOSING = {"{": "}", "[": "]"}
+JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Tokens that can appear in JSON: strings, brackets, literals, exponents and runs of numbers and separators
+JSON_VALID_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]|true|false|null|[eE]\d*|(?:[\s,:]|[+-]?\d+(?:\.\d+)?(?![\d.]))*')
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+def _json_schema_error(value, schema: dict | None) -> str | None:
+    if schema is None:
+        return None
+    if not isinstance(value, dict):
+        return "LLM output is not a JSON object"
+    for field, expected in schema.items():
+        if field not in value:
+            return f"LLM output is missing '{field}'"
+        # bool is a subclass of int, but a boolean is never a valid number here
+        if expected is not object and (
+            not isinstance(value[field], expected)
+            or expected is int and isinstance(value[field], bool)
+        ):
+            return f"LLM output field '{field}' is not of type {expected.__name__}"
+    return None
+
+
+def extract_json(text: str, schema: dict | None = None):
+    """
+    Returns the first JSON object or array found in an LLM output.
+    When a schema is given, returns the first object whose fields exist with the given
+    types (object: any type), skipping other values such as a "[3]" quoted in the prose.
+    Python literals outside strings, trailing commas and // comments are tolerated.
+    A value nested in another one is never returned on its own, so a truncated answer
+    fails instead of yielding one of its fields. Runs in linear time.
+    Raises ValueError when no matching value is found.
+    """
+    try:
+        # Fast path for outputs that are already plain JSON
+        value = json.loads(text, strict=False)
+    except (ValueError, RecursionError):
+        value = None
+    if isinstance(value, (dict, list)):
+        error = _json_schema_error(value, schema)
+        if error:
+            raise ValueError(error)
+        return value
+
+    # Rewrite the output as JSON tokens. A value may start at a bracket outside any other
+    # bracket, or at a bracket that follows prose rather than JSON, e.g. "[see {...}]"
+    out = []
+    prose = [0]  # running count of prose tokens in out
+    starts = []
+    closes = {}  # index in out of an opening bracket -> index of its closing bracket
+    stack = []   # (expected closing bracket, index of the opening bracket in out)
+    after_prose = False
+    for token in JSON_TOKEN_PATTERN.finditer(text):
+        token = token.group()
+        if token.startswith("//"):
+            continue
+        if token in JSON_CLOSING:
+            if not stack or after_prose:
+                starts.append(len(out))
+            stack.append((JSON_CLOSING[token], len(out)))
+        elif token in ("}", "]"):
+            # Drop trailing commas, also across whitespace and skipped comments
+            index = len(out) - 1
+            while index >= 0 and out[index][:1] not in ('"', "{", "[", "}", "]"):
+                stripped = out[index].rstrip(", \t\r\n")
+                out[index] = stripped
+                if stripped:
+                    break
+                index -= 1
+            if stack and stack[-1][0] == token:
+                closes[stack.pop()[1]] = len(out)
+            else:
+                stack = []
+        else:
+            token = JSON_LITERALS.get(token, token)
+        is_prose = not JSON_VALID_TOKEN_PATTERN.fullmatch(token)
+        out.append(token)
+        prose.append(prose[-1] + is_prose)
+        if token.strip():
+            after_prose = is_prose
+
+    offsets = [0]
+    for token in out:
+        offsets.append(offsets[-1] + len(token))
+    cleaned = "".join(out)
+
+    # A span holding prose is skipped without decoding. The spans that are decoded hold
+    # no prose, hence no other start, so they never overlap and the work stays linear.
+    error = None
+    for start in starts:
+        end = closes.get(start)
+        if end is None or prose[end + 1] != prose[start]:
+            continue
+        try:
+            value = JSON_DECODER.decode(cleaned[offsets[start]:offsets[end + 1]])
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        candidate_error = _json_schema_error(value, schema)
+        if candidate_error is None:
+            return value
+        error = error or candidate_error
+    raise ValueError(error or "No JSON value found in LLM output")
+
+
+class FlightData:
+    def __init__(self, _flight_number: str, _flight_date: str, _flight_time: str, _flight_from: str, _flight_to: str, _num_passengers_paid_insurance: int, _insurance_value_per_passenger: int):
+        self.flight_number = _flight_number
+        self.flight_date = _flight_date
+        self.flight_time = _flight_time
+        self.flight_from = _flight_from
+        self.flight_to = _flight_to
+        self.num_passengers_paid_insurance = _num_passengers_paid_insurance
+        self.loss_payment_value_per_passenger = _insurance_value_per_passenger
+        self.flight_arrival_delayed = False
+        self.balances = {} # passenger address -> paid out insurance
+
+
+# Flight Insurance Pool is the multi-flight variant of the Flight Insurance Intelligent Contract.
+# Instead of one contract per flight, the insurance manager adds many flights to one pool,
+# each keyed by its flightaware resolution url, with its own passengers and balances.
+# resolve_flights checks the status of many flights at once: every page is fetched once,
+# and the pages of a chunk are classified together in a single equivalence round.
+class FlightInsurancePool(IContract):
+
+    def __init__(self):
+        self.insurance_manager = contract_runner.from_address
+        self.flights = {} # resolution url -> FlightData
+        self.manager_balances = {} # resolution url -> insurance manager balance for that flight
+        self.resolve_chunk_size = 10 # flight pages classified per equivalence round
+
+    def _resolution_url(self, _flight_number: str, _flight_date: str, _flight_time: str, _flight_from: str, _flight_to: str) ->str:
+        resolution_url = "https://flightaware.com/live/flight/" + _flight_number + "/history/"
+        resolution_url = resolution_url + _flight_date + "/" + _flight_time + "/"
+        return resolution_url + _flight_from + "/" + _flight_to
+
+    def _get_flight(self, _resolution_url: str) ->FlightData:
+        if _resolution_url not in self.flights:
+            raise Exception("unknown flight: " + _resolution_url)
+        return self.flights[_resolution_url]
+
+    def add_flight(self, _flight_number: str, _flight_date: str, _flight_time: str, _flight_from: str, _flight_to: str, _num_passengers_paid_insurance: int, _insurance_value_per_passenger: int) ->str:
+        if contract_runner.from_address != self.insurance_manager:
+            raise Exception("only the insurance manager can add flights")
+        resolution_url = self._resolution_url(_flight_number, _flight_date, _flight_time, _flight_from, _flight_to)
+        if resolution_url in self.flights:
+            raise Exception("flight already in the pool: " + resolution_url)
+        self.flights[resolution_url] = FlightData(_flight_number, _flight_date, _flight_time, _flight_from, _flight_to, _num_passengers_paid_insurance, _insurance_value_per_passenger)
+        self.manager_balances[resolution_url] = _num_passengers_paid_insurance*_insurance_value_per_passenger
+        return resolution_url
+
+    def set_resolve_chunk_size(self, _resolve_chunk_size: int) ->None:
+        if contract_runner.from_address != self.insurance_manager:
+            raise Exception("only the insurance manager can change the chunk size")
+        if _resolve_chunk_size <= 0:
+            raise Exception("chunk size must be positive")
+        self.resolve_chunk_size = _resolve_chunk_size
+
+    def add_passenger(self, _resolution_url: str, _passenger_address: str) ->None:
+        flight = self._get_flight(_resolution_url)
+        # Registering an address again must not reset a payout it already received
+        if _passenger_address == self.insurance_manager or _passenger_address in flight.balances:
+            return
+        flight.balances[_passenger_address] = 0
+
+    async def resolve_flights(self, _batch: list[str]) ->dict:
+        # Same url means same flight page: fetch it once, and skip flights already known to be delayed
+        pending = []
+        for resolution_url in dict.fromkeys(_batch):
+            if not self._get_flight(resolution_url).flight_arrival_delayed:
+                pending.append(resolution_url)
+
+        for i in range(0, len(pending), self.resolve_chunk_size):
+            chunk = pending[i:i + self.resolve_chunk_size]
+            statuses = await self._classify_flights(chunk)
+            for resolution_url in chunk:
+                if statuses.get(resolution_url) is True:
+                    self.flights[resolution_url].flight_arrival_delayed = True
+
+        return {resolution_url: self._get_flight(resolution_url).flight_arrival_delayed for resolution_url in dict.fromkeys(_batch)}
+
+    async def _classify_flights(self, _chunk: list[str]) ->dict:
+        final_result = {}
+        async with EquivalencePrinciple(
+            result=final_result,
+            principle="The arrivalstatus of every flight should be the similar",
+            comparative=True,
+        ) as eq:
+            pages = await asyncio.gather(*[eq.get_webpage(resolution_url) for resolution_url in _chunk])
+            web_data = ""
+            for index, page in enumerate(pages):
+                web_data = web_data + f"Flight {index} web page content:\n{page}\nEnd of flight {index} web page data.\n\n"
+            prompt = f"""
+In the following web pages, find for every flight if its arrival was late or not:
+{web_data}
+Respond using ONLY the following format:
+{{
+"flights": [
+    {{
+    "flight": int, // the number of the flight web page
+    "arrivalstatus": bool // True if the flight arrival was delayed or False if it was on time
+    }}
+]
+}}
+It is mandatory that you respond only using the JSON format above,
+nothing else. Don't include any other words or characters,
+your output must be only JSON without any formatting prefix or suffix.
+This result should be perfectly parseable by a JSON parser without errors.
+"""
+            result = await eq.call_llm(prompt)
+            print("result: ")
+            print(result)
+            output = extract_json(result, {"flights": list})
+            statuses = {}
+            for flight in output["flights"]:
+                index = flight.get("flight")
+                if isinstance(index, int) and 0 <= index < len(_chunk) and isinstance(flight.get("arrivalstatus"), bool):
+                    statuses[_chunk[index]] = flight["arrivalstatus"]
+            eq.set(json.dumps(statuses))
+        return json.loads(final_result["output"])
+
+    def insurance_claim(self, _resolution_url: str, _passenger_address: str) ->None:
+        flight = self._get_flight(_resolution_url)
+        if flight.flight_arrival_delayed is True:
+            if _passenger_address in flight.balances:
+              if flight.balances[_passenger_address] == 0:
+                flight.balances[_passenger_address] = flight.loss_payment_value_per_passenger
+                self.manager_balances[_resolution_url] = (self.manager_balances[_resolution_url]-flight.loss_payment_value_per_passenger)
+
+    def get_flights(self) ->list[str]:
+        return list(self.flights.keys())
+
+    def get_flight(self, _resolution_url: str) ->dict:
+        flight = self._get_flight(_resolution_url)
+        return {
+            "flight_number": flight.flight_number,
+            "flight_date": flight.flight_date,
+            "flight_time": flight.flight_time,
+            "flight_from": flight.flight_from,
+            "flight_to": flight.flight_to,
+            "num_passengers_paid_insurance": flight.num_passengers_paid_insurance,
+            "loss_payment_value_per_passenger": flight.loss_payment_value_per_passenger,
+            "flight_arrival_delayed": flight.flight_arrival_delayed,
+        }
+
+    def get_flight_status(self, _resolution_url: str) ->bool:
+        return self._get_flight(_resolution_url).flight_arrival_delayed
+
+    def get_insurance_balance(self, _resolution_url: str, _passenger_address: str) ->int:
+        return self._get_flight(_resolution_url).balances.get(_passenger_address, 0)
+
+    def get_insurance_manager_balance(self, _resolution_url: str) ->int:
+        self._get_flight(_resolution_url)
+        return self.manager_balances[_resolution_url]
+
+    def get_insurance_manager(self) ->str:
+        return self.insurance_manager
@@ -1,7 +1,188 @@
 import json
+import re
+import time
+from datetime import datetime, timezone
 from backend.node.genvm.icontract import IContract
 from backend.node.genvm.equivalence_principle import EquivalencePrinciple
 
+
+# Strings, // comments, bare words, brackets and runs of anything else, in that order
+JSON_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|//[^\n]*|[A-Za-z_]\w*|[{}\[\]]|[^"{}\[\]/A-Za-z_]+|["/]')
+JSON_CLOSING = {"{": "}", "[": "]"}
+JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Tokens that can appear in JSON: strings, brackets, literals, exponents and runs of numbers and separators
+JSON_VALID_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]|true|false|null|[eE]\d*|(?:[\s,:]|[+-]?\d+(?:\.\d+)?(?![\d.]))*')
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+def _json_schema_error(value, schema: dict | None) -> str | None:
+    if schema is None:
+        return None
+    if not isinstance(value, dict):
+        return "LLM output is not a JSON object"
+    for field, expected in schema.items():
+        if field not in value:
+            return f"LLM output is missing '{field}'"
+        # bool is a subclass of int, but a boolean is never a valid number here
+        if expected is not object and (
+            not isinstance(value[field], expected)
+            or expected is int and isinstance(value[field], bool)
+        ):
+            return f"LLM output field '{field}' is not of type {expected.__name__}"
+    return None
+
+
+def extract_json(text: str, schema: dict | None = None):
+    """
+    Returns the first JSON object or array found in an LLM output.
+    When a schema is given, returns the first object whose fields exist with the given
+    types (object: any type), skipping other values such as a "[3]" quoted in the prose.
+    Python literals outside strings, trailing commas and // comments are tolerated.
+    A value nested in another one is never returned on its own, so a truncated answer
+    fails instead of yielding one of its fields. Runs in linear time.
+    Raises ValueError when no matching value is found.
+    """
+    try:
+        # Fast path for outputs that are already plain JSON
+        value = json.loads(text, strict=False)
+    except (ValueError, RecursionError):
+        value = None
+    if isinstance(value, (dict, list)):
+        error = _json_schema_error(value, schema)
+        if error:
+            raise ValueError(error)
+        return value
+
+    # Rewrite the output as JSON tokens. A value may start at a bracket outside any other
+    # bracket, or at a bracket that follows prose rather than JSON, e.g. "[see {...}]"
+    out = []
+    prose = [0]  # running count of prose tokens in out
+    starts = []
+    closes = {}  # index in out of an opening bracket -> index of its closing bracket
+    stack = []   # (expected closing bracket, index of the opening bracket in out)
+    after_prose = False
+    for token in JSON_TOKEN_PATTERN.finditer(text):
+        token = token.group()
+        if token.startswith("//"):
+            continue
+        if token in JSON_CLOSING:
+            if not stack or after_prose:
+                starts.append(len(out))
+            stack.append((JSON_CLOSING[token], len(out)))
+        elif token in ("}", "]"):
+            # Drop trailing commas, also across whitespace and skipped comments
+            index = len(out) - 1
+            while index >= 0 and out[index][:1] not in ('"', "{", "[", "}", "]"):
+                stripped = out[index].rstrip(", \t\r\n")
+                out[index] = stripped
+                if stripped:
+                    break
+                index -= 1
+            if stack and stack[-1][0] == token:
+                closes[stack.pop()[1]] = len(out)
+            else:
+                stack = []
+        else:
+            token = JSON_LITERALS.get(token, token)
+        is_prose = not JSON_VALID_TOKEN_PATTERN.fullmatch(token)
+        out.append(token)
+        prose.append(prose[-1] + is_prose)
+        if token.strip():
+            after_prose = is_prose
+
+    offsets = [0]
+    for token in out:
+        offsets.append(offsets[-1] + len(token))
+    cleaned = "".join(out)
+
+    # A span holding prose is skipped without decoding. The spans that are decoded hold
+    # no prose, hence no other start, so they never overlap and the work stays linear.
+    error = None
+    for start in starts:
+        end = closes.get(start)
+        if end is None or prose[end + 1] != prose[start]:
+            continue
+        try:
+            value = JSON_DECODER.decode(cleaned[offsets[start]:offsets[end + 1]])
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        candidate_error = _json_schema_error(value, schema)
+        if candidate_error is None:
+            return value
+        error = error or candidate_error
+    raise ValueError(error or "No JSON value found in LLM output")
+
+
+# Flightaware history pages show the gate arrival time followed by the scheduled one,
+# e.g. "Gate Arrival 08:21 WEST (scheduled 07:55 WEST)", and a summary like "Arrived 26 minutes late"
+ARRIVAL_TIMES_PATTERN = re.compile(
+    r"(?:Gate Arrival|Landing)\s+(\d{1,2}):(\d{2})\s*([AP]M)?[^(\d]{0,40}\(scheduled\s+(\d{1,2}):(\d{2})\s*([AP]M)?",
+    re.IGNORECASE,
+)
+# Before landing the same fields hold estimates, so times are only read once the page
+# shows the flight as arrived or landed
+LANDED_PATTERN = re.compile(r"\b(?:arrived|landed)\b", re.IGNORECASE)
+ARRIVED_PATTERN = re.compile(
+    r"\barrived\s+(?:(\d+)\s*h(?:ours?|rs?)?\s*)?(?:(\d+)\s*m(?:in(?:ute)?s?)?\s+)?(late|early|on time)\b",
+    re.IGNORECASE,
+)
+
+
+def _minutes_of_day(hours: str, minutes: str, meridiem: str | None) -> int:
+    hours = int(hours) % 12 if meridiem else int(hours)
+    if meridiem and meridiem.upper() == "PM":
+        hours += 12
+    return hours*60 + int(minutes)
+
+
+def parse_arrival_delay(web_data: str) -> int | None:
+    """
+    Returns the arrival delay in minutes (negative when early) read from a flightaware
+    history page, or None when the page doesn't show it in a known format or the
+    flight has not arrived yet.
+    """
+    if not LANDED_PATTERN.search(web_data):
+        return None
+
+    match = ARRIVAL_TIMES_PATTERN.search(web_data)
+    if match:
+        actual = _minutes_of_day(match.group(1), match.group(2), match.group(3))
+        scheduled = _minutes_of_day(match.group(4), match.group(5), match.group(6) or match.group(3))
+        delay = actual - scheduled
+        # Arrivals around midnight
+        if delay < -12*60:
+            delay += 24*60
+        elif delay > 12*60:
+            delay -= 24*60
+        return delay
+
+    match = ARRIVED_PATTERN.search(web_data)
+    if match:
+        if match.group(3).lower() == "on time":
+            return 0
+        if match.group(1) is None and match.group(2) is None:
+            return None
+        delay = int(match.group(1) or 0)*60 + int(match.group(2) or 0)
+        return delay if match.group(3).lower() == "late" else -delay
+    return None
+
+
+async def agreed_time() -> int:
+    """
+    Current unix time agreed by the leader and the validators. Every node reads its own clock,
+    and the leader's reading is kept when the others are close to it. Decisions and state based
+    on it are then the same on every node, unlike with time.time().
+    """
+    final_result = {}
+    async with EquivalencePrinciple(
+        result=final_result,
+        principle="The timestamps should be within 60 seconds of each other",
+        comparative=True,
+    ) as eq:
+        eq.set(str(int(time.time())))
+    return int(final_result["output"])
+
+
 # Flight Insurance Intelligent Contract is a contract that allows passengers to buy insurance for their flights.
 # The contract is created by the insurance manager for specific flight 
 # and the passengers can buy insurance for this specific flight.
@@ -26,6 +207,19 @@ class FlightInsurance(IContract):
         self.balances = {}
         self.balances[contract_runner.from_address] = _num_passengers_paid_insurance*_insurance_value_per_passenger
         self.insurance_manager = contract_runner.from_address
+        # Poll schedule for ask_for_flight_status, all times are unix timestamps in seconds, read with agreed_time
+        self.scheduled_time = self._parse_scheduled_time(_flight_date, _flight_time)
+        self.arrival_poll_delay = 30*60 # first poll this long after the scheduled time
+        self.poll_interval = 15*60 # doubles after every poll without a final verdict
+        self.max_poll_interval = 4*60*60
+        self.final_status_after = 24*60*60 # an on time verdict is final this long after the scheduled time
+        self.next_poll_time = self.scheduled_time + self.arrival_poll_delay
+        self.last_fetch_time = 0
+        self.flight_status_final = False
+        # Registered passengers that have not been paid yet, so payouts can be computed on read
+        self.num_unpaid_passengers = 0
+        # Arrivals later than this are considered delayed when the page can be parsed without the LLM
+        self.delay_threshold_minutes = 15
     
     # Example of constructor with hardcoded values to save time in the testing
     # def __init__(self):
@@ -44,7 +238,31 @@ class FlightInsurance(IContract):
     #     self.balances[contract_runner.from_address] = self.loss_payment_value_per_passenger*self.loss_payment_value_per_passenger
     #     self.insurance_manager = contract_runner.from_address
 
+    def _parse_scheduled_time(self, _flight_date: str, _flight_time: str) ->int:
+        # flight_date is like "20240818" and flight_time like "0510Z" (UTC)
+        scheduled = datetime.strptime(_flight_date + _flight_time.rstrip("Z"), "%Y%m%d%H%M")
+        return int(scheduled.replace(tzinfo=timezone.utc).timestamp())
+
+    def set_poll_schedule(self, _arrival_poll_delay: int, _poll_interval: int, _max_poll_interval: int) ->None:
+        if contract_runner.from_address != self.insurance_manager:
+            raise Exception("only the insurance manager can change the poll schedule")
+        if _poll_interval <= 0 or _max_poll_interval < _poll_interval:
+            raise Exception("invalid poll intervals")
+        self.arrival_poll_delay = _arrival_poll_delay
+        self.poll_interval = _poll_interval
+        self.max_poll_interval = _max_poll_interval
+        if self.last_fetch_time == 0:
+            self.next_poll_time = self.scheduled_time + self.arrival_poll_delay
+
     async def ask_for_flight_status(self) -> None:
+        if self.flight_status_final:
+            print("flight status is final, not polling again")
+            return
+        now = await agreed_time()
+        if now < self.next_poll_time:
+            print("next flight status poll is not due until " + str(self.next_poll_time))
+            return
+
         print("calling the page: " + self.resolution_url)
         final_result = {}
         async with EquivalencePrinciple(
@@ -58,32 +276,15 @@ class FlightInsurance(IContract):
             print(web_data)
             print(" ")
             print(" ")
-            prompt = f"""
-In the following web page, find if the flight arrival was late or not:
-Web page content:
-{web_data} 
-End of web page data.
-Respond using ONLY the following format:
-{{
-"arrivalstatus": bool // True if the flight arrival was delayed or False if it was on time
-}}
-It is mandatory that you respond only using the JSON format above,
-nothing else. Don't include any other words or characters,
-your output must be only JSON without any formatting prefix or suffix.
-This result should be perfectly parseable by a JSON parser without errors.
-"""
-            result = await eq.call_llm(prompt)
-            print("********************************")
-            print("result: ")
-            print(result)     
-            print("================================")   
-            result_clean = result.replace("True", "true").replace("False", "false")
+            output = self._parse_flight_status(web_data)
+            if output is None:
+                output = await self._ask_llm_for_flight_status(eq, web_data)
+            result_clean = json.dumps(output)
             print("********************************")
             print("result_clean: ")
             print(result_clean)
             print("================================")   
             eq.set(result_clean)
-            output = json.loads(result_clean)
             print("********************************")
             print("output: ")
             print(output["arrivalstatus"])
@@ -94,27 +295,108 @@ This result should be perfectly parseable by a JSON parser without errors.
                 print("flight_arrival_delayed: ")
                 print(self.flight_arrival_delayed)
                 print("================================")
+
+        self.last_fetch_time = now
+        if self.flight_arrival_delayed or now >= self.scheduled_time + self.final_status_after:
+            self.flight_status_final = True
+        else:
+            # Back off until the next poll
+            self.next_poll_time = now + self.poll_interval
+            self.poll_interval = min(self.poll_interval*2, self.max_poll_interval)
+
+    def _parse_flight_status(self, web_data: str) ->dict | None:
+        delay = parse_arrival_delay(web_data)
+        if delay is None:
+            return None
+        print("parsed arrival delay in minutes: " + str(delay))
+        return {"arrivalstatus": delay > self.delay_threshold_minutes}
+
+    async def _ask_llm_for_flight_status(self, eq: EquivalencePrinciple, web_data: str) ->dict:
+        prompt = f"""
+In the following web page, find if the flight arrival was late or not.
+Only a flight that has already arrived can be late: estimated times don't count.
+Web page content:
+{web_data} 
+End of web page data.
+Respond using ONLY the following format:
+{{
+"arrivalstatus": bool // True if the flight arrived late, False if it was on time or has not arrived yet
+}}
+It is mandatory that you respond only using the JSON format above,
+nothing else. Don't include any other words or characters,
+your output must be only JSON without any formatting prefix or suffix.
+This result should be perfectly parseable by a JSON parser without errors.
+"""
+        result = await eq.call_llm(prompt)
+        print("********************************")
+        print("result: ")
+        print(result)     
+        print("================================")   
+        return extract_json(result, {"arrivalstatus": bool})
+
+    def set_delay_threshold_minutes(self, _delay_threshold_minutes: int) ->None:
+        if contract_runner.from_address != self.insurance_manager:
+            raise Exception("only the insurance manager can change the delay threshold")
+        self.delay_threshold_minutes = _delay_threshold_minutes
     
     def add_passenger(self, _passenger_address:str) ->None:
+        # Registering an address again must not reset a payout it already received
+        if _passenger_address == self.insurance_manager or _passenger_address in self.balances:
+            return
         self.balances[_passenger_address] = 0
+        self.num_unpaid_passengers += 1
+
+    def add_passengers(self, _passenger_addresses:list[str]) ->None:
+        for passenger_address in _passenger_addresses:
+            self.add_passenger(passenger_address)
 
     def insurance_claim(self, _passenger_address:str) ->None:
-        if self.flight_arrival_delayed is True:
-            if _passenger_address in self.balances:
-              if self.balances[_passenger_address] == 0:
-                self.balances[_passenger_address] = self.loss_payment_value_per_passenger
-                self.balances[self.insurance_manager] = (self.balances[self.insurance_manager]-self.loss_payment_value_per_passenger)
+        if self.get_claimable(_passenger_address) > 0:
+            self.balances[_passenger_address] = self.loss_payment_value_per_passenger
+            self.balances[self.insurance_manager] = (self.balances[self.insurance_manager]-self.loss_payment_value_per_passenger)
+            self.num_unpaid_passengers -= 1
+
+    def settle_all_claims(self) ->int:
+        # Pays every registered passenger in one pass and updates the manager balance once
+        if self.flight_arrival_delayed is not True or self.num_unpaid_passengers == 0:
+            return 0
+        paid = 0
+        for passenger_address, balance in self.balances.items():
+            if passenger_address != self.insurance_manager and balance == 0:
+                self.balances[passenger_address] = self.loss_payment_value_per_passenger
+                paid += 1
+        self.balances[self.insurance_manager] = (self.balances[self.insurance_manager]-paid*self.loss_payment_value_per_passenger)
+        self.num_unpaid_passengers = 0
+        return paid
+
+    def get_claimable(self, _passenger_address:str) ->int:
+        # Payout a passenger is owed but has not been written to its balance yet
+        if self.flight_arrival_delayed is True and _passenger_address != self.insurance_manager:
+            if self.balances.get(_passenger_address) == 0:
+                return self.loss_payment_value_per_passenger
+        return 0
 
     def get_flight_status(self) ->bool:
         return self.flight_arrival_delayed
+
+    def get_flight_status_final(self) ->bool:
+        return self.flight_status_final
+
+    def get_next_poll_time(self) ->int:
+        return self.next_poll_time
+
+    def get_last_fetch_time(self) ->int:
+        return self.last_fetch_time
     
     def get_insurance_balance(self, _passenger_address:str) ->int:
         if _passenger_address in self.balances:
-            return self.balances[_passenger_address]
+            return self.balances[_passenger_address] + self.get_claimable(_passenger_address)
         else:
             return 0
 
     def get_insurance_manager_balance(self) ->int:
+        if self.flight_arrival_delayed is True:
+            return self.balances[self.insurance_manager] - self.num_unpaid_passengers*self.loss_payment_value_per_passenger
         return self.balances[self.insurance_manager]
       
     def get_insurance_manager(self) ->str:
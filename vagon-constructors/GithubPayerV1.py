@@ -1,9 +1,48 @@
 from backend.node.genvm.icontract import IContract
 from backend.node.genvm.equivalence_principle import EquivalencePrinciple
 
+import asyncio
 import json
+import time
+from itertools import islice
+
+async def agreed_time() -> int:
+    """
+    Current unix time agreed by the leader and the validators. Every node reads its own clock,
+    and the leader's reading is kept when the others are close to it. Decisions and state based
+    on it are then the same on every node, unlike with time.time().
+    """
+    final_result = {}
+    async with EquivalencePrinciple(
+        result=final_result,
+        principle="The timestamps should be within 60 seconds of each other",
+        comparative=True,
+    ) as eq:
+        eq.set(str(int(time.time())))
+    return int(final_result["output"])
+
+def parse_issue_numbers(value) -> list[int] | None:
+    """
+    Issue numbers from an LLM answer, e.g. [12, "#13", "14"] -> [12, 13, 14].
+    Entries that are not issue numbers are skipped. Returns None if the answer is not a list.
+    """
+    if not isinstance(value, list):
+        return None
+    numbers = []
+    for entry in value:
+        if isinstance(entry, str):
+            entry = entry.strip().lstrip("#")
+            if not entry.isdigit():
+                continue
+            entry = int(entry)
+        elif not isinstance(entry, int) or isinstance(entry, bool):
+            continue
+        if entry > 0 and entry not in numbers:
+            numbers.append(entry)
+    return numbers
 
 class BountyData:
+    __slots__ = ("issue", "value", "claimed")
     issue: int
     value: int
     claimed: bool
@@ -12,29 +51,80 @@ class BountyData:
         self.value = 0
         self.claimed = False
 
+    def to_dict(self) -> dict:
+        return {"issue": self.issue, "value": self.value, "claimed": self.claimed}
+
 class GithubPayer(IContract):
     def __init__(self, repo: str):
         self.repo_raw = repo
         self.repo = "https://github.com/" + repo
         self.users = {}
         self.owner = contract_runner.from_address
-        self.bounties = {}
+        self.open_bounties = {} # issue -> BountyData, not claimed yet
+        self.claimed_bounties = {} # issue -> BountyData
+        self.verifications = {} # "username:address" -> agreed time of the verification
+        self.verification_ttl = 24 * 60 * 60
+        self.verification_hits = 0
+        self.verification_misses = 0
         pass
     
     def get_bounties(self) -> str:
         r = {}
-        for k, v in self.bounties.items():
-            r[k] = {"issue": v.issue, "value": v.value, "claimed": v.claimed}
+        for k, v in self.open_bounties.items():
+            r[k] = v.to_dict()
+        for k, v in self.claimed_bounties.items():
+            r[k] = v.to_dict()
         return json.dumps(r)
+
+    def get_open_bounties(self, offset: int, limit: int) -> list[dict]:
+        if offset < 0 or limit < 0:
+            raise Exception("offset and limit must be non-negative")
+        return [v.to_dict() for v in islice(self.open_bounties.values(), offset, offset + limit)]
+
+    def get_bounty_counts(self) -> dict:
+        return {"open": len(self.open_bounties), "claimed": len(self.claimed_bounties)}
     
+    def get_verification_stats(self) -> str:
+        lookups = self.verification_hits + self.verification_misses
+        return json.dumps({
+            "hits": self.verification_hits,
+            "misses": self.verification_misses,
+            "hit_rate": self.verification_hits / lookups if lookups else 0.0,
+            "cached": len(self.verifications),
+            "ttl": self.verification_ttl,
+        })
+
+    def set_verification_ttl(self, ttl: int):
+        if contract_runner.from_address != self.owner:
+            raise Exception("only owner")
+        if ttl < 0:
+            raise Exception("ttl must be non-negative")
+        self.verification_ttl = ttl
+
+    def invalidate_verification(self, username: str, address: str):
+        if contract_runner.from_address != self.owner:
+            raise Exception("only owner")
+        self.verifications.pop(username + ":" + address, None)
+
     def add_bounty(self, issue: int):
-        bounty = self.bounties.setdefault(issue, BountyData(issue))
-        if bounty.claimed:
+        if issue in self.claimed_bounties:
             raise Exception("can't add bounty to claimed issue")
+        bounty = self.open_bounties.get(issue)
+        if bounty is None:
+            bounty = self.open_bounties[issue] = BountyData(issue)
         bounty.value += 1 # message.value
 
     async def register(self, username: str) -> None:
         address = contract_runner.from_address
+        cache_key = username + ":" + address
+
+        now = await agreed_time()
+        verified_at = self.verifications.get(cache_key)
+        if verified_at is not None and now - verified_at < self.verification_ttl:
+            self.verification_hits += 1
+            self.users[username] = address
+            return
+        self.verification_misses += 1
 
         final_result = {}
         async with EquivalencePrinciple(
@@ -49,7 +139,9 @@ class GithubPayer(IContract):
                 eq.set(False)
         print(final_result)
         if not final_result["output"]:
+            self.verifications.pop(cache_key, None)
             raise Exception("couldn't verify, user must have an address listed")
+        self.verifications[cache_key] = now
         self.users[username] = address
 
     async def claim(self, pull: int) -> None:
@@ -89,12 +181,90 @@ class GithubPayer(IContract):
         if not res["merged"]:
             raise Exception("pull is not mergerd")
         address = self.users[res["user"]]
-        for b in res["issue"]:
-            bounty = self.bounties.get(b, None)
-            if bounty is None:
+        self._settle(address, res["issue"])
+
+    async def claim_many(self, pulls: list[int]) -> str:
+        pulls = list(dict.fromkeys(pulls))
+        final_result = {}
+        async with EquivalencePrinciple(
+            result=final_result,
+            principle="The result should be exactly the same",
+            comparative=True,
+        ) as eq:
+            api_pages = await asyncio.gather(*[
+                eq.get_webpage("https://api.github.com/repos/" + self.repo_raw + "/pulls/" + str(pull))
+                for pull in pulls
+            ])
+            res = {}
+            bodies = {}
+            for pull, api_data in zip(pulls, api_pages):
+                api_data = json.loads(api_data)
+                res[str(pull)] = {
+                    "merged": api_data["merged_at"] is not None,
+                    "user": api_data["user"]["login"],
+                    "issue": [],
+                }
+                if res[str(pull)]["merged"]:
+                    bodies[str(pull)] = api_data.get("body") or ""
+
+            if bodies:
+                # One LLM round for every merged pull request instead of one per pull
+                descriptions = "\n".join(
+                    f"Pull request #{pull}:\n{body}\nEnd of pull request #{pull}.\n"
+                    for pull, body in bodies.items()
+                )
+                prompt = f"""
+            In the following GitHub pull request descriptions, find the issues closed by each pull request
+
+            {descriptions}
+
+            Respond with the following JSON format:
+            {{
+                "<pull request number>": int[], // numbers of closed issues, one entry per pull request
+            }}
+
+            It is mandatory that you respond only using the JSON format above, nothing else. Don't include any other words or characters, your output must be only JSON without any formatting prefix or suffix. This result should be perfectly parseable by a JSON parser without errors.
+            """
+                try:
+                    issues = json.loads(await eq.call_llm(prompt))
+                except ValueError:
+                    issues = None
+                if not isinstance(issues, dict):
+                    issues = {}
+                for pull in bodies:
+                    # None marks a pull whose closed issues couldn't be read from the answer
+                    res[pull]["issue"] = parse_issue_numbers(issues.get(pull))
+            eq.set(res)
+        res = final_result["output"]
+        print(res)
+
+        outcomes = {}
+        for pull in pulls:
+            pr = res[str(pull)]
+            if not pr["merged"]:
+                outcomes[pull] = {"status": "not_merged", "claimed": []}
                 continue
-            if bounty.claimed:
+            address = self.users.get(pr["user"])
+            if address is None:
+                outcomes[pull] = {"status": "unregistered", "claimed": []}
+                continue
+            if pr["issue"] is None:
+                outcomes[pull] = {"status": "unparsed", "claimed": []}
+                continue
+            # Issues shared with an earlier pull in the batch are already claimed here
+            claimed = self._settle(address, pr["issue"])
+            outcomes[pull] = {"status": "claimed" if claimed else "no_bounty", "claimed": claimed}
+        return json.dumps(outcomes)
+
+    def _settle(self, address: str, issues: list[int]) -> list[int]:
+        claimed = []
+        for b in issues:
+            bounty = self.open_bounties.pop(b, None)
+            if bounty is None:
                 continue
             #transfer(address, bounty.value)
             print(f"claiming {b}")
             bounty.claimed = True
+            self.claimed_bounties[b] = bounty
+            claimed.append(b)
+        return claimed
@@ -1,13 +1,61 @@
 import json
 import math
+import re
+import time
+from itertools import islice
 from backend.node.genvm.icontract import IContract
 from backend.node.genvm.equivalence_principle import (
     EquivalencePrinciple,
     get_webpage_with_principle,
 )
 
+# Matches GitHub closing keywords in a pull request body, e.g. "Fixes #12" or "closes: #7"
+CLOSING_KEYWORD_PATTERN = re.compile(
+    r"\b(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s*:?\s*#(\d+)\b", re.IGNORECASE
+)
+
+
+def resolve_pull_request(pull_data: dict, reviews: list) -> dict:
+    """
+    Resolves a pull request from the GitHub REST JSON of the pulls and reviews
+    endpoints. The issue comes from a closing keyword in the pull request body,
+    written by its author. Timeline cross-references are not used: anyone can
+    mention a pull request from another issue. "issue" is None when the body
+    has no closing keyword.
+    """
+    issue = None
+    match = CLOSING_KEYWORD_PATTERN.search(pull_data.get("body") or "")
+    if match:
+        issue = int(match.group(1))
+
+    return {
+        "merged": pull_data.get("merged_at") is not None,
+        "username": pull_data["user"]["login"],
+        "issue": issue,
+        "changes_requested": sum(
+            1 for review in reviews if review.get("state") == "CHANGES_REQUESTED"
+        ),
+    }
+
+
+async def agreed_time() -> int:
+    """
+    Current unix time agreed by the leader and the validators. Every node reads its own clock,
+    and the leader's reading is kept when the others are close to it. Decisions and state based
+    on it are then the same on every node, unlike with time.time().
+    """
+    final_result = {}
+    async with EquivalencePrinciple(
+        result=final_result,
+        principle="The timestamps should be within 60 seconds of each other",
+        comparative=True,
+    ) as eq:
+        eq.set(str(int(time.time())))
+    return int(final_result["output"])
+
 
 class BountyData:
+    __slots__ = ("issue", "points", "claimed")
     issue: int
     points: int
     claimed: bool
@@ -17,14 +65,23 @@ class BountyData:
         self.points = points
         self.claimed = False
 
+    def to_dict(self) -> dict:
+        return {"issue": self.issue, "points": self.points, "claimed": self.claimed}
+
 
 class GitBounties(IContract):
     def __init__(self, github_repository: str):
         self.owner = contract_runner.from_address
         self.repository = "https://github.com/" + github_repository
+        self.api_repository = "https://api.github.com/repos/" + github_repository
         self.developers = {}  # Mapping from: GitHub username -> Address
         self.points = {}  # Mapping from: GitHub username -> points earned
-        self.bounties = {}  # Mapping from: Issue number -> BountyData
+        self.open_bounties = {}  # Mapping from: Issue number -> unclaimed BountyData
+        self.claimed_bounties = {}  # Mapping from: Issue number -> claimed BountyData
+        self.verifications = {}  # Mapping from: "username:address" -> agreed time of the verification
+        self.verification_ttl = 24 * 60 * 60  # Seconds a profile verification stays valid
+        self.verification_hits = 0
+        self.verification_misses = 0
         pass
 
     def get_developers(self) -> dict:
@@ -35,28 +92,76 @@ class GitBounties(IContract):
 
     def get_bounties(self) -> dict:
         bounties = {}
-        for k, v in self.bounties.items():
-            bounties[k] = {"issue": v.issue, "points": v.points, "claimed": v.claimed}
+        for k, v in self.open_bounties.items():
+            bounties[k] = v.to_dict()
+        for k, v in self.claimed_bounties.items():
+            bounties[k] = v.to_dict()
         return bounties
 
+    def get_open_bounties(self, offset: int, limit: int) -> list[dict]:
+        if offset < 0 or limit < 0:
+            raise Exception("offset and limit must be non-negative")
+        return [
+            v.to_dict()
+            for v in islice(self.open_bounties.values(), offset, offset + limit)
+        ]
+
+    def get_bounty_counts(self) -> dict:
+        return {"open": len(self.open_bounties), "claimed": len(self.claimed_bounties)}
+
+    def get_verification_stats(self) -> dict:
+        lookups = self.verification_hits + self.verification_misses
+        return {
+            "hits": self.verification_hits,
+            "misses": self.verification_misses,
+            "hit_rate": self.verification_hits / lookups if lookups else 0.0,
+            "cached": len(self.verifications),
+            "ttl": self.verification_ttl,
+        }
+
+    def set_verification_ttl(self, ttl: int):
+        if self.owner != contract_runner.from_address:
+            raise Exception("only owner")
+        if ttl < 0:
+            raise Exception("ttl must be non-negative")
+        self.verification_ttl = ttl
+
+    def invalidate_verification(self, github_username: str, developer_address: str):
+        # Forces the next register() for this pair to refetch the GitHub profile
+        if self.owner != contract_runner.from_address:
+            raise Exception("only owner")
+        self.verifications.pop(f"{github_username}:{developer_address}", None)
+
     def add_bounty(self, issue: int, points: int):
         if self.owner != contract_runner.from_address:
             raise Exception("only owner")
 
-        bounty = self.bounties.setdefault(issue, BountyData(issue, points))
-        if bounty.claimed:
+        if issue in self.claimed_bounties:
             raise Exception("can't add bounty to claimed issue")
+        if issue not in self.open_bounties:
+            self.open_bounties[issue] = BountyData(issue, points)
 
     async def register(self, github_username: str) -> None:
         dev_github_profile = f"https://github.com/{github_username}"
         developer_address = contract_runner.from_address
+        cache_key = f"{github_username}:{developer_address}"
+
+        now = await agreed_time()
+        verified_at = self.verifications.get(cache_key)
+        if verified_at is not None and now - verified_at < self.verification_ttl:
+            self.verification_hits += 1
+            self.developers[github_username] = developer_address
+            return
+        self.verification_misses += 1
 
         web_data = await get_webpage_with_principle(
             dev_github_profile, "The result should be exactly the same"
         )
         if developer_address in web_data["output"]:
+            self.verifications[cache_key] = now
             self.developers[github_username] = developer_address
         else:
+            self.verifications.pop(cache_key, None)
             raise Exception(
                 "Couldn't verify the developer, GitHub profile page must have the given address on its bio"
             )
@@ -68,53 +173,61 @@ class GitBounties(IContract):
             principle="The result should be exactly the same",
             comparative=True,
         ) as eq:
-            web_data = await eq.get_webpage(self.repository + "/pull/" + str(pull))
-            task = f"""
-            The following web page content corresponds to a GitHub pull request.
-
-            Web page content:
-            {web_data}
-            End of web page data.
-
-            In that Pull Request, a developer should be fixing an issue from the repository 
-            issues list: located at: https://github.com/cristiam86/genlayer-hackaton/issues
+            pull_url = f"{self.api_repository}/pulls/{pull}"
+            pull_data = json.loads(await eq.get_webpage(pull_url))
+            reviews = json.loads(await eq.get_webpage(pull_url + "/reviews?per_page=100"))
+            res = resolve_pull_request(pull_data, reviews)
 
-            To fin the issue, you should look for a text like "Fixes: #<issue_number>" in the 
-            Pull Request first comment.
-            It is very important to also include information about how many times a given PR has
-            ben rejected (changes requested), son include the number of those as well.
-
-            Respond with the following JSON format:
-            {{
-                "merged":  boolean, // if pull request was merged
-                "username": string, // GitHub username of the developer who opened a pull request
-                "issue":  int, // number of the closed issue
-                "changes_requested": int // number of changes requested for the given pull request  
-            }}
+            if res["issue"] is None and res["merged"]:
+                # No closing keyword, fall back to the LLM for the free-text body only
+                res["issue"] = await self._extract_issue_with_llm(eq, pull_data.get("body") or "")
 
-            It is mandatory that you respond only using the JSON format above, nothing else.
-            Don't include any other words or characters, your output must be only JSON without any
-            formatting prefix or suffix. This result should be perfectly parseable by a
-            JSON parser without errors.
-            """
-            result = await eq.call_llm(task)
-            print("\nresult: ", result)
-            eq.set(result)
+            print("\nresult: ", res)
+            eq.set(json.dumps(res))
 
         res = json.loads(final_result["output"])
         if not res["merged"]:
             raise Exception("pull is not mergerd")
 
+        if res["issue"] is None:
+            raise Exception("pull is not linked to an issue")
+
         bounty_issue = res["issue"]
         bounty_username = res["username"]
         pull_request_changes_requested = res["changes_requested"]
-        bounty = self.bounties.get(bounty_issue, None)
+        bounty = self.open_bounties.pop(bounty_issue, None)
 
-        if bounty and not bounty.claimed:
+        if bounty:
             bounty.claimed = True
+            self.claimed_bounties[bounty_issue] = bounty
             if not bounty_username in self.points:
                 self.points[bounty_username] = 0
             total_points = math.floor(
                 bounty.points / (pull_request_changes_requested + 1)
             )
             self.points[bounty_username] += 1 if total_points <= 1 else total_points
+
+    async def _extract_issue_with_llm(self, eq: EquivalencePrinciple, body: str) -> int | None:
+        task = f"""
+            The following text is the description of a GitHub pull request.
+
+            Pull request description:
+            {body}
+            End of pull request description.
+
+            The developer should mention the issue of the repository {self.repository}
+            fixed by this pull request, usually with a text like "Fixes: #<issue_number>".
+
+            Respond with the following JSON format:
+            {{
+                "issue":  int | null // number of the fixed issue, null if none is mentioned
+            }}
+
+            It is mandatory that you respond only using the JSON format above, nothing else.
+            Don't include any other words or characters, your output must be only JSON without any
+            formatting prefix or suffix. This result should be perfectly parseable by a
+            JSON parser without errors.
+            """
+        result = await eq.call_llm(task)
+        issue = json.loads(result).get("issue")
+        return int(issue) if issue is not None else None